@@ -0,0 +1,70 @@
+import argparse
+import sys
+from pathlib import Path
+
+import torch
+
+FILE = Path(__file__).resolve()
+TEMP_ROOT = FILE.parents[0]
+ROOT = FILE.parents[0] / 'yolov9'
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))  # add ROOT to PATH
+
+from model_backend import BACKENDS, load_model, select_prediction
+from yolov9.utils.dataloaders import LoadImages
+from yolov9.utils.general import LOGGER, Profile, check_img_size, non_max_suppression
+from yolov9.utils.torch_utils import select_device, smart_inference_mode
+
+
+@smart_inference_mode()
+def benchmark(weights, source, data, imgsz, device, backend, half=False):
+    # latency and throughput of one backend on the images of source, model load and export excluded
+    model = load_model(weights, backend, device=device, data=data, fp16=half, imgsz=imgsz)
+    if backend != 'pytorch' and model.pt:
+        backend += '->pytorch'  # export or loading failed and load_model fell back
+    imgsz = check_img_size(imgsz, s=model.stride)
+    dataset = LoadImages(source, img_size=imgsz, stride=model.stride, auto=False)
+    model.warmup(imgsz=(1, 3, *imgsz))
+
+    seen, dt = 0, (Profile(), Profile(), Profile())
+    for path, im, im0s, vid_cap, s in dataset:
+        with dt[0]:
+            im = torch.from_numpy(im).to(model.device)
+            im = im.half() if model.fp16 else im.float()
+            im = im[None] / 255
+        with dt[1]:
+            pred = select_prediction(model(im))
+        with dt[2]:
+            non_max_suppression(pred, 0.25, 0.45, max_det=1000)
+        seen += 1
+    total = sum(x.t for x in dt)
+    return [backend] + [x.t / max(seen, 1) * 1E3 for x in dt] + [seen / max(total, 1E-9)]
+
+
+def main(opt):
+    device = select_device(opt.device)
+    results = []
+    for backend in opt.backends:
+        results.append(benchmark(opt.weights, opt.source, opt.data, opt.imgsz, device, backend, opt.half))
+
+    LOGGER.info(f"\n{'backend':>20} {'pre-process':>12} {'inference':>12} {'NMS':>12} {'img/s':>10}")
+    for backend, pre, inf, nms, fps in results:
+        LOGGER.info(f'{backend:>20} {pre:>10.1f}ms {inf:>10.1f}ms {nms:>10.1f}ms {fps:>10.1f}')
+
+
+def parse_opt():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--weights', type=str, default=TEMP_ROOT / 'yolov9-s.pt')
+    parser.add_argument('--source', type=str, default='/data/images')
+    parser.add_argument('--data', type=str, default=TEMP_ROOT / 'coco.yaml')
+    parser.add_argument('--imgsz', nargs='+', type=int, default=[640, 640])
+    parser.add_argument('--device', default='cpu')
+    parser.add_argument('--half', action='store_true')
+    parser.add_argument('--backends', nargs='+', default=list(BACKENDS), choices=list(BACKENDS))
+    opt = parser.parse_args()
+    opt.imgsz *= 2 if len(opt.imgsz) == 1 else 1
+    return opt
+
+
+if __name__ == '__main__':
+    main(parse_opt())
@@ -0,0 +1,52 @@
+import argparse
+import os
+import threading
+from queue import Queue
+
+from s3_uploader import MB, S3Uploader
+
+
+def worker(uploader, task_queue):
+    while True:
+        task = task_queue.get()
+        if task is None:
+            return
+        uploader.upload_bytes(*task)
+
+
+def main(opt):
+    # run against a local S3 stand-in, e.g. MinIO or `moto_server -p 5000` with --endpoint-url http://127.0.0.1:5000
+    uploader = S3Uploader(opt.bucket, endpoint_url=opt.endpoint_url, num_thread=opt.threads,
+                          multipart_threshold=opt.multipart_threshold * MB)
+    if opt.create_bucket:
+        uploader.client.create_bucket(Bucket=opt.bucket)
+
+    payload = os.urandom(int(opt.size * 1024))
+    task_queue = Queue(maxsize=opt.threads * 4)
+    trd_list = [threading.Thread(target=worker, args=(uploader, task_queue), daemon=True) for _ in range(opt.threads)]
+    for trd in trd_list:
+        trd.start()
+    for idx in range(opt.num):
+        task_queue.put((f'{opt.prefix}/{idx:08d}.bin', payload))
+    for _ in trd_list:
+        task_queue.put(None)
+    for trd in trd_list:
+        trd.join()
+    print(uploader.stats.summary())
+
+
+def parse_opt():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--bucket', type=str, default='benchmark')
+    parser.add_argument('--endpoint-url', type=str, default=os.environ.get('S3_ENDPOINT_URL') or None)
+    parser.add_argument('--create-bucket', action='store_true', help='create the bucket before uploading')
+    parser.add_argument('--prefix', type=str, default='upload-benchmark')
+    parser.add_argument('--num', type=int, default=1000, help='number of objects')
+    parser.add_argument('--size', type=float, default=200, help='object size in KB')
+    parser.add_argument('--threads', type=int, default=4, help='number of transport threads')
+    parser.add_argument('--multipart-threshold', type=int, default=8, help='multipart threshold in MB')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main(parse_opt())
@@ -0,0 +1,105 @@
+import os
+import threading
+from time import sleep, time
+
+try:
+    from inotify_simple import INotify, flags
+except ImportError:  # polling fallback, e.g. on file systems or platforms without inotify
+    INotify = None
+
+
+class Ledger:
+    # append-only list of processed files, so that a restarted agent skips work it has already done
+    def __init__(self, path=None):
+        self.path = path
+        self.lock = threading.Lock()
+        self.done = set()
+        if path and os.path.isfile(path):
+            with open(path, 'r') as f:
+                self.done.update(line.rstrip('\n') for line in f if line.strip())
+
+    def __contains__(self, file):
+        return file in self.done
+
+    def __len__(self):
+        return len(self.done)
+
+    def add(self, file):
+        with self.lock:
+            if file in self.done:
+                return
+            self.done.add(file)
+            if self.path:
+                with open(self.path, 'a') as f:
+                    f.write(file + '\n')
+
+
+def _scan(source, formats):
+    files = {}
+    for entry in os.scandir(source):
+        if entry.is_file() and entry.name.split('.')[-1].lower() in formats:
+            stat = entry.stat()
+            files[entry.path] = (stat.st_size, stat.st_mtime)
+    return files
+
+
+def _stat(file):
+    try:
+        stat = os.stat(file)
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime
+
+
+def watch_files(source, formats, period=1.0, ledger=None):
+    # yield the image files of source forever: the existing ones first, then new ones as they are completed.
+    # inotify reports completed files (CLOSE_WRITE, MOVED_TO). Files found by a scan, i.e. at startup, after the
+    # inotify queue overflowed or by the polling fallback, may still be written, so they are yielded once their
+    # size and mtime did not change for one period
+    source = os.path.abspath(source)
+    ledger = ledger if ledger is not None else Ledger()
+    yielded = set()
+
+    inotify = None
+    if INotify is not None:
+        try:
+            inotify = INotify()
+            inotify.add_watch(source, flags.CLOSE_WRITE | flags.MOVED_TO)
+        except OSError:
+            inotify = None
+
+    pending = {file: state for file, state in _scan(source, formats).items() if file not in ledger}
+    check_time = time()
+    while True:
+        rescan = inotify is None
+        if inotify is not None:
+            for event in inotify.read(timeout=int(period * 1000)):
+                if event.mask & flags.Q_OVERFLOW:  # events were dropped, the directory has to be scanned again
+                    rescan = True
+                    continue
+                file = os.path.join(source, event.name)
+                if event.name.split('.')[-1].lower() in formats and file not in ledger and file not in yielded:
+                    pending.pop(file, None)
+                    yielded.add(file)
+                    yield file
+        else:
+            sleep(period)
+        if not rescan and (len(pending) == 0 or time() - check_time < period):
+            continue
+
+        now = time()
+        current = _scan(source, formats) if rescan else {file: _stat(file) for file in pending}
+        for file, state in sorted(current.items()):
+            if state is None:  # deleted before it was complete
+                pending.pop(file, None)
+                continue
+            if file in yielded or file in ledger:
+                continue
+            # a file is complete once its size and mtime did not change since the previous check
+            if pending.get(file) == state and state[1] < check_time:
+                pending.pop(file)
+                yielded.add(file)
+                yield file
+            else:
+                pending[file] = state
+        check_time = now
@@ -0,0 +1,57 @@
+from pathlib import Path
+
+from yolov9.models.common import DetectMultiBackend
+from yolov9.utils.general import LOGGER
+
+
+# backend name -> (yolov9 export format, exported artifact of weights)
+BACKENDS = {
+    'pytorch': (None, lambda w: w),
+    'torchscript': ('torchscript', lambda w: w.with_suffix('.torchscript')),
+    'onnx': ('onnx', lambda w: w.with_suffix('.onnx')),
+    'openvino': ('openvino', lambda w: w.parent / f'{w.stem}_openvino_model'),
+}
+
+
+def export_weights(weights, backend, imgsz, batch_size=1, device='cpu', data=None):
+    # export once and reuse the artifact as long as it is newer than the checkpoint
+    weights = Path(weights)
+    fmt, artifact = BACKENDS[backend]
+    if fmt is None:
+        return weights
+    file = artifact(weights)
+    if file.exists() and file.stat().st_mtime >= weights.stat().st_mtime:
+        return file
+
+    from yolov9.export import run as export_run  # heavy import, only needed on a cache miss
+
+    LOGGER.info(f'Exporting {weights} to {backend}, the artifact is cached at {file}')
+    # dynamic axes so that partial batches can run on the same artifact
+    export_run(data=data, weights=weights, imgsz=imgsz, batch_size=batch_size, device=device, include=(fmt,),
+               dynamic=fmt in ('onnx', 'openvino'))
+    if not file.exists():
+        raise FileNotFoundError(f'{backend} export did not produce {file}')
+    return file
+
+
+def load_model(weights, backend='pytorch', device=None, dnn=False, data=None, fp16=False, imgsz=(640, 640), batch_size=1):
+    # load weights with the requested backend and fall back to the PyTorch checkpoint if export or loading fails
+    if backend not in BACKENDS:
+        raise ValueError(f'unknown backend {backend}, choose one of {list(BACKENDS)}')
+    if backend != 'pytorch':
+        try:
+            export_device = 'cpu' if device is None or device.type == 'cpu' else str(device.index or 0)
+            file = export_weights(weights, backend, imgsz, batch_size, export_device, data)
+            return DetectMultiBackend(file, device=device, dnn=dnn, data=data, fp16=fp16)
+        except Exception as e:
+            LOGGER.warning(f'{backend} backend is not available ({e}), falling back to pytorch')
+    return DetectMultiBackend(weights, device=device, dnn=dnn, data=data, fp16=fp16)
+
+
+def select_prediction(pred):
+    # dual-head YOLOv9 returns ([aux, main], train_out) from PyTorch and [aux, main] from exported runtimes
+    if isinstance(pred, (list, tuple)) and isinstance(pred[0], (list, tuple)):
+        pred = pred[0]
+    if isinstance(pred, (list, tuple)):
+        return pred[1] if len(pred) > 1 else pred[0]
+    return pred
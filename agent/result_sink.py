@@ -0,0 +1,96 @@
+import gzip
+import io
+import json
+import logging
+import threading
+from datetime import datetime
+from pathlib import Path
+from time import time
+
+from metrics import REGISTRY
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # JSON-lines only
+    pa = None
+
+
+LOGGER = logging.getLogger('agent')
+RECORDS = REGISTRY.counter('agent_detection_records_total', 'Detection records uploaded by the result sink')
+LOST_RECORDS = REGISTRY.counter('agent_detection_records_lost_total', 'Detection records which failed to be uploaded')
+
+
+class ResultSink:
+    # collect one detection record per image and upload them in batches next to the images:
+    # s3://{bucket}/{prefix}/detections/{time}_{name}_{seq}.jsonl.gz (or .parquet)
+    def __init__(self, uploader, prefix, name='0', max_records=10000, max_age=60, fmt='jsonl'):
+        if fmt == 'parquet' and pa is None:
+            raise ImportError('pyarrow is required for the parquet result format')
+        self.uploader = uploader
+        self.prefix = prefix
+        self.name = name
+        self.max_records = max_records
+        self.max_age = max_age
+        self.fmt = fmt
+        self.lock = threading.Lock()
+        self.records = []
+        self.first_time = None
+        self.seq = 0
+        self.stop_event = threading.Event()
+        self.flush_trd = threading.Thread(target=self._flush_periodically, daemon=True, name='result_sink')
+        self.flush_trd.start()
+
+    def add(self, path, det, shape, model, timings):
+        # det is an (n, 6) tensor of x1, y1, x2, y2, conf, cls in pixels of the original image
+        record = {
+            'key': f'{self.prefix}/{Path(path).name}',
+            'model': model,
+            'time': datetime.now().isoformat(timespec='milliseconds'),
+            'width': int(shape[1]),
+            'height': int(shape[0]),
+            'cls': det[:, 5].int().tolist(),
+            'conf': [round(c, 4) for c in det[:, 4].tolist()],
+            'box': det[:, :4].int().tolist(),
+            'ms': [round(t * 1E3, 2) for t in timings],  # pre-process, inference, NMS per image
+        }
+        with self.lock:
+            if not self.records:
+                self.first_time = time()
+            self.records.append(record)
+            full = len(self.records) >= self.max_records
+        if full:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            records, self.records = self.records, []
+            seq, self.seq = self.seq, self.seq + (1 if records else 0)
+        if not records:
+            return
+        key = f'{self.prefix}/detections/{datetime.now().strftime("%Y%m%d%H%M%S")}_{self.name}_{seq:05d}'
+        try:
+            if self.fmt == 'parquet':
+                buf = io.BytesIO()
+                pq.write_table(pa.Table.from_pylist(records), buf, compression='zstd')
+                self.uploader.upload_bytes(f'{key}.parquet', buf.getvalue())
+            else:
+                data = ''.join(json.dumps(r, separators=(',', ':')) + '\n' for r in records)
+                self.uploader.upload_bytes(f'{key}.jsonl.gz', gzip.compress(data.encode('utf-8')))
+        except Exception as e:  # the records of this batch are lost, keep the sink alive
+            LOGGER.error('%d detection records failed to be transported to s3: %s', len(records), e)
+            LOST_RECORDS.inc(len(records))
+            return
+        RECORDS.inc(len(records))
+
+    def close(self):
+        self.stop_event.set()
+        self.flush_trd.join()
+        self.flush()
+
+    def _flush_periodically(self):
+        while not self.stop_event.wait(1):
+            with self.lock:
+                expired = self.records and time() - self.first_time >= self.max_age
+            if expired:
+                self.flush()
@@ -1,12 +1,16 @@
 import argparse
+import logging
+import multiprocessing
 import os
 import platform
 import sys
 import threading
+import zlib
 from pathlib import Path
 from datetime import datetime
-from time import sleep
+from time import time
 
+import numpy as np
 import torch
 
 FILE = Path(__file__).resolve()
@@ -18,6 +22,7 @@ sys.path.append('yolov9')
 ROOT = Path(os.path.relpath(ROOT, Path.cwd()))  # relative
 
 from yolov9.models.common import DetectMultiBackend
+from yolov9.utils.augmentations import letterbox
 from yolov9.utils.dataloaders import IMG_FORMATS, VID_FORMATS, LoadImages, LoadScreenshots, LoadStreams
 from yolov9.utils.general import (LOGGER, Profile, check_file, check_img_size, check_imshow, check_requirements, colorstr, cv2,
                            increment_path, non_max_suppression, print_args, scale_boxes, strip_optimizer, xyxy2xywh)
@@ -26,12 +31,128 @@ from yolov9.utils.torch_utils import select_device, smart_inference_mode
 
 import boto3
 import cv2
-from smart_open import open as sopen
-from queue import Queue
+from queue import Queue, Empty
+
+from file_watch import Ledger, watch_files
+from metrics import REGISTRY, dump_metrics, serve_metrics, setup_logging
+from model_backend import load_model, select_prediction
+from result_sink import ResultSink
+from s3_uploader import S3Uploader
+
+
+# bounded so that the inference loop blocks (backpressure) when S3 uploads fall behind
+QUEUE = Queue(maxsize=int(os.environ.get('UPLOAD_QUEUE_SIZE', 64)))
+TRANSPORT_LOGGER = logging.getLogger('agent')
+UPLOAD_FAILURES = REGISTRY.counter('agent_upload_failures_total', 'Images which failed to be uploaded after the retries')
+QUEUE_DEPTH = REGISTRY.gauge('agent_upload_queue_depth', 'Images waiting for a transport thread')
+QUEUE_DEPTH.set_function(QUEUE.qsize)
+
+
+class PinnedStaging:
+    # a few page-locked batch buffers reused across batches. Pinning fresh memory per frame costs more than the
+    # pageable copy it saves, so frames stay pageable and are stacked into a pinned buffer for one async H2D copy.
+    # A buffer is only refilled after its previous copy has finished
+    def __init__(self, device, num_buffer=2, max_shape=4):
+        self.device = device
+        self.num_buffer = num_buffer
+        self.max_shape = max_shape  # e.g. the last partial batch, or rect letterboxing
+        self.slots = {}  # shape: [[pinned buffer, copy event], ...]
+        self.turn = {}
+
+    def to_device(self, ims):
+        shape = (len(ims), *ims[0].shape)
+        if shape not in self.slots:
+            if len(self.slots) >= self.max_shape:
+                oldest = next(iter(self.slots))
+                for _, event in self.slots.pop(oldest):
+                    if event is not None:
+                        event.synchronize()
+                self.turn.pop(oldest)
+            self.slots[shape] = []
+            self.turn[shape] = 0
+        slots = self.slots[shape]
+        if len(slots) < self.num_buffer:
+            slots.append([torch.empty(shape, dtype=ims[0].dtype).pin_memory(), None])
+        slot = slots[self.turn[shape] % len(slots)]
+        self.turn[shape] += 1
+        if slot[1] is not None:
+            slot[1].synchronize()
+        torch.stack(ims, out=slot[0])
+        im = slot[0].to(self.device, non_blocking=True)
+        slot[1] = torch.cuda.Event()
+        slot[1].record()
+        return im
+
+
+def load_frames(dataset, frame_queue):
+    # read frames in the background so that a batch can be flushed on timeout
+    for path, im, im0s, vid_cap, s in dataset:
+        frame_queue.put((path, torch.from_numpy(im), im0s, s, dataset.mode, getattr(dataset, 'frame', 0)))
+    frame_queue.put(None)
 
 
-QUEUE = Queue()
-TERMINATE_FLAG = False
+def decode_worker(task_queue, frame_queue, img_size, stride, auto, decode_times, idx):
+    # decode and letterbox images ahead of the model; decode_times[idx] accumulates busy seconds
+    while True:
+        task = task_queue.get()
+        if task is None:
+            return
+        t0 = time()
+        num, total, path = task
+        im0 = cv2.imread(path)  # BGR
+        if im0 is None:
+            LOGGER.warning(f'Image Not Found {path}')
+            continue
+        im = letterbox(im0, img_size, stride=stride, auto=auto)[0]  # padded resize
+        im = np.ascontiguousarray(im.transpose((2, 0, 1))[::-1])  # HWC to CHW, BGR to RGB
+        im = torch.from_numpy(im)
+        decode_times[idx] += time() - t0
+        frame_queue.put((path, im, im0, f'image {num}/{total} {path}: ', 'image', 0))
+
+
+def prefetch_frames(dataset, files, total, frame_queue, workers, img_size, stride, auto, decode_times):
+    # videos must be read sequentially, so only image-only sources are decoded in parallel
+    if dataset is not None and (workers < 1 or any(dataset.video_flag)):
+        load_frames(dataset, frame_queue)
+        return
+
+    workers = max(workers, 1)
+    task_queue = Queue(maxsize=workers * 4)
+    trd_list = []
+    for idx in range(workers):
+        trd_list.append(threading.Thread(target=decode_worker,
+                                         args=(task_queue, frame_queue, img_size, stride, auto, decode_times, idx),
+                                         daemon=True, name=f'decode_#{idx}'))
+    for trd in trd_list:
+        trd.start()
+    for num, path in enumerate(files):  # files may be an endless generator in watch mode
+        task_queue.put((num + 1, total, path))
+    for _ in trd_list:
+        task_queue.put(None)
+    for trd in trd_list:
+        trd.join()
+    frame_queue.put(None)
+
+
+def collect_batch(frame_queue, batch_size, batch_timeout):
+    # block for the first frame, then fill the batch until it is full or batch_timeout expires
+    frame = frame_queue.get()
+    if frame is None:
+        return [], True
+    batch = [frame]
+    deadline = time() + batch_timeout
+    while len(batch) < batch_size:
+        remaining = deadline - time()
+        if remaining <= 0:
+            break
+        try:
+            frame = frame_queue.get(timeout=remaining)
+        except Empty:
+            break
+        if frame is None:
+            return batch, True
+        batch.append(frame)
+    return batch, False
 
 
 @smart_inference_mode()
@@ -63,9 +184,18 @@ def run(
         half=False,  # use FP16 half-precision inference
         dnn=False,  # use OpenCV DNN for ONNX inference
         vid_stride=1,  # video frame-rate stride
+        batch_size=1,  # number of images per forward pass
+        batch_timeout=0.1,  # max seconds to wait for a full batch before flushing a partial one
+        workers=4,  # number of prefetch threads decoding and letterboxing images ahead of the model
+        upload_annotated=False,  # upload frames with boxes drawn instead of the original image files
+        watch=False,  # keep running and process images as they are added to the source directory
+        watch_period=1.0,  # watch mode polling interval in seconds (inotify is used when available)
+        ledger=None,  # Ledger of processed files which are skipped
+        backend='pytorch',  # pytorch, torchscript, onnx or openvino; exported once and cached next to weights
+        shard=(0, 1),  # (index, count) of this worker, it only processes its own share of the source files
+        sink=None,  # ResultSink receiving one detection record per image
 ):
     global QUEUE
-    global TERMINATE_FLAG
 
     source = str(source)
     save_img = not nosave and not source.endswith('.txt')  # save inference images
@@ -85,33 +215,61 @@ def run(
 
     # Load model
     device = select_device(device)
-    model = DetectMultiBackend(weights, device=device, dnn=dnn, data=data, fp16=half)
+    imgsz = check_img_size(imgsz, s=32)  # check image size, the stride of YOLOv9 models is 32
+    model = load_model(weights, backend, device=device, dnn=dnn, data=data, fp16=half, imgsz=imgsz, batch_size=batch_size)
     stride, names, pt = model.stride, model.names, model.pt
     imgsz = check_img_size(imgsz, s=stride)  # check image size
+    model_version = f"{Path(weights).stem}:{'pytorch' if pt else backend}"
 
     # Dataloader
-    bs = 1  # batch_size
-    dataset = LoadImages(source, img_size=imgsz, stride=stride, auto=pt, vid_stride=vid_stride)
+    bs = batch_size  # batch_size
+    # batched images must share one shape, so letterbox to the full imgsz instead of the minimum rectangle
+    auto = pt and bs == 1
+    ledger = ledger if ledger is not None else Ledger()
+    shard_index, shard_count = shard
+    if watch:
+        dataset, total = None, '?'
+        files = (f for f in watch_files(source, IMG_FORMATS, period=watch_period, ledger=ledger)
+                 if zlib.crc32(f.encode()) % shard_count == shard_index)  # stable split of an endless stream
+    else:
+        dataset = LoadImages(source, img_size=imgsz, stride=stride, auto=auto, vid_stride=vid_stride)
+        files = [f for n, f in enumerate(dataset.files) if n % shard_count == shard_index and f not in ledger]
+        total = len(files)
+        if workers < 1 or any(dataset.video_flag):  # sequential loading, restricted to the files of this shard
+            dataset = LoadImages(files, img_size=imgsz, stride=stride, auto=auto, vid_stride=vid_stride) if files else None
     vid_path, vid_writer = [None] * bs, [None] * bs
+    staging = PinnedStaging(model.device) if model.device.type == 'cuda' else None
+    frame_queue = Queue(maxsize=bs * max(workers, 1) * 2)  # bounded so decoding cannot run far ahead of the model
+    decode_times = [0.0] * max(workers, 1)
+    threading.Thread(target=prefetch_frames,
+                     args=(dataset, files, total, frame_queue, workers, imgsz, stride, auto, decode_times),
+                     daemon=True, name='prefetch').start()
 
     # Run inference
     model.warmup(imgsz=(1 if pt or model.triton else bs, 3, *imgsz))  # warmup
     seen, windows, dt = 0, [], (Profile(), Profile(), Profile())
-    for path, im, im0s, vid_cap, s in dataset:
-        QUEUE.put([im0s, path])
-
+    done = False
+    while not done:
+        # dt[0] only counts the time the model waits for input, i.e. decoding that was not hidden by prefetch
         with dt[0]:
-            im = torch.from_numpy(im).to(model.device)
+            batch, done = collect_batch(frame_queue, bs, batch_timeout)
+            if not batch:
+                break
+            paths, ims, im0ss, ss, modes, frames = zip(*batch)
+            im = staging.to_device(ims) if staging is not None else torch.stack(ims).to(model.device)
             im = im.half() if model.fp16 else im.float()  # uint8 to fp16/32
             im /= 255  # 0 - 255 to 0.0 - 1.0
-            if len(im.shape) == 3:
-                im = im[None]  # expand for batch dim
+
+        # original image files are shipped as-is; only video frames and annotated frames need encoding
+        for path, im0s, mode in zip(paths, im0ss, modes):
+            if not upload_annotated:
+                QUEUE.put([None if mode == 'image' else im0s, path, mode == 'image'])  # blocks while the transport threads are behind
 
         # Inference
         with dt[1]:
-            visualize = increment_path(save_dir / Path(path).stem, mkdir=True) if visualize else False
+            visualize = increment_path(save_dir / Path(paths[0]).stem, mkdir=True) if visualize else False
             pred = model(im, augment=augment, visualize=visualize)
-            pred = pred[0][1]
+            pred = select_prediction(pred)
 
         # NMS
         with dt[2]:
@@ -123,11 +281,11 @@ def run(
         # Process predictions
         for i, det in enumerate(pred):  # per image
             seen += 1
-            p, im0, frame = path, im0s.copy(), getattr(dataset, 'frame', 0)
+            p, im0, s, frame = paths[i], im0ss[i].copy(), ss[i], frames[i]
 
             p = Path(p)  # to Path
             save_path = str(save_dir / p.name)  # im.jpg
-            txt_path = str(save_dir / 'labels' / p.stem) + ('' if dataset.mode == 'image' else f'_{frame}')  # im.txt
+            txt_path = str(save_dir / 'labels' / p.stem) + ('' if modes[i] == 'image' else f'_{frame}')  # im.txt
             s += '%gx%g ' % im.shape[2:]  # print string
             gn = torch.tensor(im0.shape)[[1, 0, 1, 0]]  # normalization gain whwh
             imc = im0.copy() if save_crop else im0  # for save_crop
@@ -135,29 +293,36 @@ def run(
             if len(det):
                 # Rescale boxes from img_size to im0 size
                 det[:, :4] = scale_boxes(im.shape[2:], det[:, :4], im0.shape).round()
+                det = det.cpu()  # one device-to-host copy for all boxes
 
                 # Print results
-                for c in det[:, 5].unique():
-                    n = (det[:, 5] == c).sum()  # detections per class
-                    s += f"{n} {names[int(c)]}{'s' * (n > 1)}, "  # add to string
+                for c, n in enumerate(torch.bincount(det[:, 5].long()).tolist()):  # detections per class
+                    if n:
+                        s += f"{n} {names[c]}{'s' * (n > 1)}, "  # add to string
 
                 # Write results
-                for *xyxy, conf, cls in reversed(det):
-                    if save_txt:  # Write to file
-                        xywh = (xyxy2xywh(torch.tensor(xyxy).view(1, 4)) / gn).view(-1).tolist()  # normalized xywh
-                        line = (cls, *xywh, conf) if save_conf else (cls, *xywh)  # label format
-                        with open(f'{txt_path}.txt', 'a') as f:
-                            f.write(('%g ' * len(line)).rstrip() % line + '\n')
-
-                    if save_img or save_crop or view_img:  # Add bbox to image
+                if save_txt:  # Write to file
+                    xywh = xyxy2xywh(det[:, :4]) / gn  # normalized xywh
+                    lines = torch.cat((det[:, 5:6], xywh, det[:, 4:5]) if save_conf else (det[:, 5:6], xywh), 1)  # label format
+                    fmt = ('%g ' * lines.shape[1]).rstrip() + '\n'
+                    with open(f'{txt_path}.txt', 'a') as f:
+                        f.write(''.join(fmt % tuple(line) for line in lines.flip(0).tolist()))
+
+                if save_img or save_crop or view_img or upload_annotated:  # Add bbox to image
+                    for *xyxy, conf, cls in reversed(det.tolist()):
                         c = int(cls)  # integer class
                         label = None if hide_labels else (names[c] if hide_conf else f'{names[c]} {conf:.2f}')
                         annotator.box_label(xyxy, label, color=colors(c, True))
-                    if save_crop:
-                        save_one_box(xyxy, imc, file=save_dir / 'crops' / names[c] / f'{p.stem}.jpg', BGR=True)
+                        if save_crop:
+                            save_one_box(xyxy, imc, file=save_dir / 'crops' / names[c] / f'{p.stem}.jpg', BGR=True)
+
+            if sink is not None:
+                sink.add(p, det.cpu(), im0.shape, model_version, [x.dt / len(batch) for x in dt])
 
             # Stream results
             im0 = annotator.result()
+            if upload_annotated:
+                QUEUE.put([im0, str(p), modes[i] == 'image'])
             if view_img:
                 if platform.system() == 'Linux' and p not in windows:
                     windows.append(p)
@@ -170,65 +335,147 @@ def run(
             if save_img:
                 cv2.imwrite(save_path, im0)
 
-        # Print time (inference-only)
-        LOGGER.info(f"{s}{'' if len(det) else '(no detections), '}{dt[1].dt * 1E3:.1f}ms ({datetime.now()})")
+            # Print time (inference-only, shared by every image of the batch)
+            LOGGER.info(f"{s}{'' if len(det) else '(no detections), '}{dt[1].dt * 1E3:.1f}ms/batch of {len(batch)} ({datetime.now()})")
 
     # Print results
-    t = tuple(x.t / seen * 1E3 for x in dt)  # speeds per image
-    LOGGER.info(f'Speed: %.1fms pre-process, %.1fms inference, %.1fms NMS per image at shape {(1, 3, *imgsz)}' % t)
+    t = tuple(x.t / max(seen, 1) * 1E3 for x in dt)  # speeds per image
+    LOGGER.info(f'Speed: %.1fms pre-process, %.1fms inference, %.1fms NMS per image at shape {(bs, 3, *imgsz)}' % t)
+    decode_t = sum(decode_times)
+    if decode_t > 0:
+        overlap = max(0.0, 1 - dt[0].t / decode_t)
+        LOGGER.info(f'Prefetch: {decode_t / max(seen, 1) * 1E3:.1f}ms decode per image on {workers} workers, '
+                    f'{overlap:.0%} hidden behind inference')
     if save_txt or save_img:
         s = f"\n{len(list(save_dir.glob('labels/*.txt')))} labels saved to {save_dir / 'labels'}" if save_txt else ''
         LOGGER.info(f"Results saved to {colorstr('bold', save_dir)}{s}")
     if update:
         strip_optimizer(weights[0])  # update model (to fix SourceChangeWarning)
 
-    TERMINATE_FLAG = True
     LOGGER.info('Inference Thread has been terminated')
 
 
-def transport(bucket_name, transport_info, prefix):
+def transport(uploader, prefix, ledger):
     global QUEUE
-    global TERMINATE_FLAG
 
     while True:
-        if QUEUE.empty():
-            if TERMINATE_FLAG:
-                print('Transport Thread has been terminated')
-                return
+        item = QUEUE.get()  # blocks until an image or the shutdown sentinel arrives
+        if item is None:
+            TRANSPORT_LOGGER.info('Transport Thread has been terminated')
+            return
+        image, path, complete = item  # complete: the item is the whole file (an image, not a video frame)
+        object_name = path.split('/')[-1]
+        try:
+            if image is None:  # unmodified image file, upload the original bytes without decoding
+                uploader.upload_file(f'{prefix}/{object_name}', path)
             else:
-                sleep(0.3)
-        else:
-            image, path = QUEUE.get()
-            object_name = path.split('/')[-1]
-            _, image_encoded = cv2.imencode('.jpg', image)
-            image_bytes = image_encoded.tobytes()
+                _, image_encoded = cv2.imencode('.jpg', image)
+                uploader.upload_bytes(f'{prefix}/{object_name}', image_encoded.tobytes())
+        except Exception as e:  # retries are exhausted; keep the thread alive for the rest of the queue
+            TRANSPORT_LOGGER.warning('%s failed to be transported to s3: %s', object_name, e)
+            UPLOAD_FAILURES.inc()
+            continue
+        if complete:  # a video is not recorded, so a restart does not skip its remaining frames
+            ledger.add(path)
+        TRANSPORT_LOGGER.debug('%s has been transported to s3', object_name)
 
-            with sopen(f's3://{bucket_name}/{prefix}/{object_name}', 'wb', transport_params=transport_info) as s3_file:
-                s3_file.write(image_bytes)
-            print(f'{object_name} has been transported to s3 ({datetime.now()})')
 
+def report_transport(stats, period, stop_event):
+    # log queue depth, upload throughput and put latency every period seconds until stop_event is set
+    while not stop_event.wait(period):
+        TRANSPORT_LOGGER.info('Transport: %s, queue depth %d/%d', stats.summary(), QUEUE.qsize(), QUEUE.maxsize)
 
-def main():
+
+def serve(device='cpu', shard=(0, 1), prefix=None):
     # config
-    num_thread = 4
+    num_thread = int(os.environ.get('UPLOAD_WORKERS', 4))
+    report_period = float(os.environ.get('UPLOAD_REPORT_PERIOD', 30))
+    batch_size = int(os.environ.get('BATCH_SIZE', 1))
+    batch_timeout = float(os.environ.get('BATCH_TIMEOUT', 0.1))
+    workers = int(os.environ.get('PREFETCH_WORKERS', 4))
+    upload_annotated = os.environ.get('UPLOAD_ANNOTATED', '0') == '1'
+    watch = os.environ.get('WATCH_SOURCE', '0') == '1'
+    watch_period = float(os.environ.get('WATCH_PERIOD', 1.0))
+    ledger = Ledger(os.environ.get('LEDGER_PATH') or None)
+    backend = os.environ.get('MODEL_BACKEND', 'pytorch')
     bucket_name = os.environ['S3_BUCKET_NAME']
     aws_session = boto3.Session(aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID'], aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY'])
-    transport_info = {'client': aws_session.client('s3')}
-    prefix = datetime.today().strftime("%Y%m%d%H%M")
+    uploader = S3Uploader(bucket_name, aws_session, endpoint_url=os.environ.get('S3_ENDPOINT_URL') or None, num_thread=num_thread,
+                          multipart_threshold=int(os.environ.get('MULTIPART_THRESHOLD_MB', 8)) * 1024 * 1024)
+    prefix = prefix or datetime.today().strftime("%Y%m%d%H%M")
+    result_format = os.environ.get('RESULT_FORMAT', 'jsonl')  # jsonl, parquet or none
+    metrics_port = int(os.environ.get('METRICS_PORT', 0))  # 0: no /metrics endpoint
+    metrics_file = os.environ.get('METRICS_FILE') or None
+    transport_logger = setup_logging('agent', os.environ.get('LOG_LEVEL', 'INFO'))
+
+    # tag the log lines of each shard, they are interleaved on the same stdout
+    shard_index, shard_count = shard
+    if shard_count > 1:
+        for handler in LOGGER.handlers:
+            handler.setFormatter(logging.Formatter(f'[shard {shard_index}/{shard_count} {device}] %(message)s'))
+        for handler in transport_logger.handlers:
+            handler.setFormatter(logging.Formatter(f'%(asctime)s %(levelname)s [shard {shard_index}/{shard_count} {device}] '
+                                                   f'%(message)s'))
+        if device == 'cpu':  # split the CPU cores between the shards instead of oversubscribing them
+            torch.set_num_threads(max(os.cpu_count() // shard_count, 1))
+
+    # detection records, uploaded in batches of RESULT_BATCH_SIZE records or every RESULT_MAX_AGE seconds
+    sink = None
+    if result_format != 'none':
+        sink = ResultSink(uploader, prefix, name=str(shard_index), fmt=result_format,
+                          max_records=int(os.environ.get('RESULT_BATCH_SIZE', 10000)),
+                          max_age=float(os.environ.get('RESULT_MAX_AGE', 60)))
+
+    # metrics of this shard: one port per shard from METRICS_PORT, one snapshot file per shard
+    stop_event = threading.Event()
+    if metrics_port:
+        serve_metrics(metrics_port + shard_index)
+    if metrics_file:
+        dump_metrics(f'{metrics_file}.{shard_index}' if shard_count > 1 else metrics_file,
+                     float(os.environ.get('METRICS_PERIOD', 15)), stop_event)
 
     # transport threads
+    stats = uploader.stats
     trd_list = []
     for _ in range(num_thread):
-        trd_list.append(threading.Thread(target=transport, args=(bucket_name, transport_info, prefix), daemon=True, name='transport'))
+        trd_list.append(threading.Thread(target=transport, args=(uploader, prefix, ledger), daemon=True, name='transport'))
     for idx in range(num_thread):
         trd_list[idx].start()
+    threading.Thread(target=report_transport, args=(stats, report_period, stop_event), daemon=True, name='transport_report').start()
 
     # inference thread
-    run()
+    run(device=device, batch_size=batch_size, batch_timeout=batch_timeout, workers=workers, upload_annotated=upload_annotated,
+        watch=watch, watch_period=watch_period, ledger=ledger, backend=backend, shard=shard,
+        sink=sink)
 
-    # wait for thread termination
+    # one sentinel per transport thread; queued images are drained before the sentinels
+    for _ in range(num_thread):
+        QUEUE.put(None)
     for idx in range(num_thread):
         trd_list[idx].join()
+    if sink is not None:
+        sink.close()
+    stop_event.set()
+    transport_logger.info('Transport: %s', stats.summary())
+
+
+def main():
+    # one inference worker per entry of DEVICES, e.g. "0,1" for two GPUs, "0,0" for two workers on one GPU
+    # or "cpu,cpu,cpu,cpu" for four CPU workers sharing the cores
+    devices = [d.strip() for d in os.environ.get('DEVICES', 'cpu').split(',') if d.strip()]
+    prefix = datetime.today().strftime("%Y%m%d%H%M")  # shared by all shards so the uploads are merged
+    if len(devices) == 1:
+        serve(devices[0], prefix=prefix)
+        return
+
+    ctx = multiprocessing.get_context('spawn')  # CUDA cannot be used in forked processes
+    proc_list = []
+    for idx, device in enumerate(devices):
+        proc_list.append(ctx.Process(target=serve, args=(device, (idx, len(devices)), prefix), name=f'shard_#{idx}'))
+    for proc in proc_list:
+        proc.start()
+    for proc in proc_list:
+        proc.join()
 
 
 if __name__ == "__main__":
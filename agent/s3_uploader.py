@@ -0,0 +1,96 @@
+import io
+import os
+import threading
+from collections import deque
+from time import time
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+
+from metrics import REGISTRY
+
+
+MB = 1024 * 1024
+OBJECTS = REGISTRY.counter('agent_objects_uploaded_total', 'Objects uploaded to S3', ['kind'])
+BYTES = REGISTRY.counter('agent_bytes_uploaded_total', 'Bytes uploaded to S3')
+RETRIES = REGISTRY.counter('agent_upload_retries_total', 'PutObject requests retried by botocore')
+PUT_SECONDS = REGISTRY.histogram('agent_put_seconds', 'Upload latency per object', ['kind'])
+
+
+class UploadStats:
+    # throughput and put latency of an S3Uploader, shared by all transport threads
+    def __init__(self, num_latency=10000):
+        self.lock = threading.Lock()
+        self.start_time = time()
+        self.num_object = 0
+        self.num_byte = 0
+        self.num_multipart = 0
+        self.latency = deque(maxlen=num_latency)  # seconds of the most recent puts
+
+    def add(self, num_byte, latency, multipart=False):
+        kind = 'multipart' if multipart else 'single'
+        OBJECTS.inc(kind=kind)
+        BYTES.inc(num_byte)
+        PUT_SECONDS.observe(latency, kind=kind)
+        with self.lock:
+            self.num_object += 1
+            self.num_byte += num_byte
+            self.num_multipart += int(multipart)
+            self.latency.append(latency)
+
+    def percentile(self, q):
+        with self.lock:
+            latency = sorted(self.latency)
+        if not latency:
+            return 0.0
+        return latency[min(int(len(latency) * q), len(latency) - 1)]
+
+    def summary(self):
+        with self.lock:
+            elapsed = max(time() - self.start_time, 1E-9)
+            num_object, num_byte, num_multipart = self.num_object, self.num_byte, self.num_multipart
+        return (f'{num_object} objects ({num_multipart} multipart), {num_byte / MB:.1f}MB transported '
+                f'({num_object / elapsed:.1f} obj/s, {num_byte / elapsed / MB:.2f}MB/s), '
+                f'put latency p50 {self.percentile(0.5) * 1E3:.1f}ms / p99 {self.percentile(0.99) * 1E3:.1f}ms')
+
+
+class S3Uploader:
+    # thread-safe upload engine: one boto3 client with a sized connection pool and adaptive retries,
+    # single PUT for small objects and concurrent multipart upload above multipart_threshold
+    def __init__(self, bucket, session=None, endpoint_url=None, num_thread=4,
+                 multipart_threshold=8 * MB, multipart_chunksize=8 * MB, multipart_concurrency=4, max_attempts=10):
+        self.bucket = bucket
+        self.multipart_threshold = multipart_threshold
+        self.stats = UploadStats()
+
+        # every transport thread may run multipart_concurrency part uploads at once
+        config = Config(max_pool_connections=num_thread * multipart_concurrency,
+                        retries={'max_attempts': max_attempts, 'mode': 'adaptive'})
+        session = session or boto3.Session()
+        self.client = session.client('s3', endpoint_url=endpoint_url, config=config)
+        self.transfer_config = TransferConfig(multipart_threshold=multipart_threshold,
+                                              multipart_chunksize=multipart_chunksize,
+                                              max_concurrency=multipart_concurrency, use_threads=True)
+
+    def upload_bytes(self, key, data):
+        start = time()
+        multipart = len(data) >= self.multipart_threshold
+        if multipart:
+            self.client.upload_fileobj(io.BytesIO(data), self.bucket, key, Config=self.transfer_config)
+        else:
+            response = self.client.put_object(Bucket=self.bucket, Key=key, Body=data)
+            RETRIES.inc(response.get('ResponseMetadata', {}).get('RetryAttempts', 0))
+        self.stats.add(len(data), time() - start, multipart)
+        return len(data)
+
+    def upload_file(self, key, path):
+        # large files are streamed from disk in parts instead of being read into memory
+        size = os.path.getsize(path)
+        if size < self.multipart_threshold:
+            with open(path, 'rb') as f:
+                return self.upload_bytes(key, f.read())
+        start = time()
+        self.client.upload_file(path, self.bucket, key, Config=self.transfer_config)
+        self.stats.add(size, time() - start, True)
+        return size
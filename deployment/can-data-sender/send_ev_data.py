@@ -1,11 +1,12 @@
 import requests
+import gzip
 import json
 import time
 import re
 import os
 import glob
 import logging
-from typing import Generator, Dict, Any
+from typing import Generator, Dict, Any, List
 from datetime import datetime
 
 # ==============================================================================
@@ -36,6 +37,14 @@ DATA_ROOT_DIR = os.environ.get("DATA_ROOT_DIR", "./daily_data")
 
 # 시뮬레이션 전송 주기 (초)
 TRANSMISSION_INTERVAL = int(os.environ.get("TRANSMISSION_INTERVAL", 10))
+
+# 일괄 전송: SEND_BATCH_SIZE건씩 모아 gzip 압축 NDJSON으로 전송 (1이면 레코드마다 SERVER_END_POINT로 전송)
+SEND_BATCH_SIZE = int(os.environ.get("SEND_BATCH_SIZE", 1))
+SERVER_BATCH_END_POINT = os.environ.get("SERVER_BATCH_END_POINT", "/api/vehicle/realtime/batch")
+SERVER_BATCH_URL = f"{SERVER_BASE_URL}{SERVER_BATCH_END_POINT}"
+
+# 서버에 연결할 수 없는 동안 보관할 최대 레코드 수 (초과 시 오래된 레코드부터 버림)
+MAX_PENDING_RECORDS = int(os.environ.get("MAX_PENDING_RECORDS", 100000))
 # ==============================================================================
 
 def preprocess_mongo_json(line: str) -> str:
@@ -105,7 +114,8 @@ def send_data_to_server(payload: Dict[str, Any]):
     try:
         response = requests.post(SERVER_URL, json=payload, timeout=5)
         
-        if response.status_code == 200:
+        # 200: DB 저장 완료, 202: 서버 수집 버퍼에 저장됨 (배치 저장 대기)
+        if response.status_code in (200, 202):
             logger.info(f"전송 성공 (URL: {SERVER_URL}, VIN: {payload.get('vin')}, Time: {payload.get('time')})")
         else:
             logger.warning(f"전송 실패 (상태 코드: {response.status_code}, 응답: {response.text})")
@@ -114,6 +124,83 @@ def send_data_to_server(payload: Dict[str, Any]):
         logger.error(f"서버 연결 오류 발생: {e} (URL: {SERVER_URL})")
 
 
+class BatchSender:
+    """
+    레코드를 모아 일괄 엔드포인트로 전송합니다.
+    전송에 실패하면(연결 오류, 429, 5xx) 레코드를 보관했다가 다음 전송 때 함께 보냅니다 (오프라인 버퍼링).
+    서버가 일괄 엔드포인트를 지원하지 않으면(404/405) 레코드별 전송으로 전환하고, 413이면 배치를 나누어 보내며,
+    그 밖의 4xx는 재전송해도 실패하므로 해당 배치를 버립니다.
+    """
+    def __init__(self, batch_size: int, max_pending: int):
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.pending: List[Dict[str, Any]] = []
+        self.session = requests.Session()
+        self.batch_supported = True
+
+    def add(self, payload: Dict[str, Any]):
+        self.pending.append(payload)
+        if len(self.pending) > self.max_pending:
+            num_dropped = len(self.pending) - self.max_pending
+            del self.pending[:num_dropped]
+            logger.warning(f"보관 레코드 초과: 오래된 레코드 {num_dropped}건 버림")
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """보관 중인 레코드를 batch_size건씩 전송합니다. 실패하면 남은 레코드를 보관하고 중단합니다."""
+        while self.pending:
+            if not self.batch_supported:
+                for payload in self.pending:
+                    send_data_to_server(payload)
+                self.pending = []
+                return
+            batch = self.pending[:self.batch_size]
+            if not self.send_batch(batch):
+                return
+
+    def send_batch(self, batch: List[Dict[str, Any]]) -> bool:
+        body = gzip.compress(b"".join(
+            json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n" for payload in batch
+        ))
+        try:
+            response = self.session.post(SERVER_BATCH_URL, data=body, timeout=30, headers={
+                "Content-Type": "application/x-ndjson",
+                "Content-Encoding": "gzip",
+            })
+        except requests.exceptions.RequestException as e:
+            logger.error(f"서버 연결 오류 발생: {e} (URL: {SERVER_BATCH_URL}, 보관 {len(self.pending)}건)")
+            return False
+
+        if response.status_code in (404, 405):
+            logger.warning(f"일괄 엔드포인트를 지원하지 않는 서버입니다 (상태 코드: {response.status_code}). 레코드별 전송으로 전환합니다.")
+            self.batch_supported = False
+            return True
+        if response.status_code == 413 and len(batch) > 1:
+            # 서버 제한보다 큰 요청: 배치 크기를 줄여 다시 전송
+            self.batch_size = max(1, len(batch) // 2)
+            logger.warning(f"요청이 너무 큽니다 (413). 배치 크기를 {self.batch_size}건으로 줄입니다.")
+            return True
+        if 400 <= response.status_code < 500 and response.status_code != 429:
+            # 재전송해도 성공할 수 없는 요청: 보관하면 뒤의 레코드까지 막히므로 버림
+            logger.error(f"일괄 전송 거부, {len(batch)}건을 버립니다 (상태 코드: {response.status_code}, 응답: {response.text})")
+            self.pending = self.pending[len(batch):]
+            return True
+        if response.status_code not in (200, 202):
+            # 429, 5xx: 보관했다가 다음 전송 때 다시 시도
+            logger.warning(f"일괄 전송 실패 (상태 코드: {response.status_code}, 응답: {response.text}, 보관 {len(self.pending)}건)")
+            return False
+
+        # 저장에 실패한 레코드(failed)만 다시 보관하고, 나머지(accepted/stored/duplicate/invalid)는 제거
+        result = response.json()
+        retry = [payload for payload, status in zip(batch, result["statuses"]) if status == "failed"]
+        for error in result.get("errors", []):
+            logger.warning(f"레코드 오류 (index: {error['index']}): {error['error']}")
+        self.pending = retry + self.pending[len(batch):]
+        logger.info(f"일괄 전송 성공 (URL: {SERVER_BATCH_URL}, {len(batch)}건, 결과: {result['counts']})")
+        return not retry
+
+
 if __name__ == "__main__":
     logger.info("--- 엣지 디바이스 시뮬레이션 시작 ---")
     logger.info(f"서버 URL: {SERVER_URL}")
@@ -125,6 +212,7 @@ if __name__ == "__main__":
         logger.warning("시뮬레이션을 시작할 데이터 파일이 없습니다. 종료합니다.")
     else:
         logger.info(f"총 {len(sorted_files)}개의 데이터 파일을 찾았습니다. 순차 처리 시작.")
+        batch_sender = BatchSender(SEND_BATCH_SIZE, MAX_PENDING_RECORDS) if SEND_BATCH_SIZE > 1 else None
         
         for file_path in sorted_files:
             logger.info(f"\n--- 파일 처리 시작: {file_path} ---")
@@ -134,10 +222,17 @@ if __name__ == "__main__":
             for full_document in data_gen:
                 try:
                     transmission_payload = extract_fields(full_document)
-                    send_data_to_server(transmission_payload)
+                    if batch_sender is not None:
+                        batch_sender.add(transmission_payload)
+                    else:
+                        send_data_to_server(transmission_payload)
                     
                 except Exception as e:
                     logger.error(f"시뮬레이션 중 예기치 않은 오류: {e}")
                 time.sleep(TRANSMISSION_INTERVAL)
             logger.info(f"--- 파일 처리 완료: {file_path} ---")
+        if batch_sender is not None:
+            batch_sender.flush()
+            if batch_sender.pending:
+                logger.warning(f"전송하지 못한 레코드 {len(batch_sender.pending)}건이 남았습니다.")
         logger.info("\n=== 모든 파일의 데이터 전송 완료. 시뮬레이션 종료. ===")
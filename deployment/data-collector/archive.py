@@ -0,0 +1,228 @@
+# archive.py
+
+import io
+import json
+import socket
+import threading
+import time
+import zlib
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from botocore.exceptions import ClientError
+
+try:
+    import zstandard
+except ImportError:  # gzip 압축으로 대체
+    zstandard = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # JSON-lines만 사용
+    pa = None
+
+# ==============================================================================
+# 원시 데이터 아카이브: 시간대별 롤링 세그먼트
+# ==============================================================================
+# 레코드를 시간대(YYYY-MM-DD-HH)별 세그먼트에 이어 붙이고, 세그먼트가 segment_bytes(압축 전)를 넘거나
+# max_age초가 지나면 S3 객체 하나로 완료합니다. JSON-lines는 압축된 데이터가 part_size만큼 쌓일 때마다
+# multipart upload의 part로 바로 올리므로 메모리 사용량이 세그먼트 크기와 무관합니다.
+#
+#   ev_data/[YYYY-MM-DD-HH]/[HOST]_[생성시각]_[SEQ].jsonl.zst   (zstandard 미설치 시 .jsonl.gz, parquet 선택 가능)
+#   ev_data/[YYYY-MM-DD-HH]/_manifest/[HOST].json             (해당 호스트가 완료한 세그먼트 목록)
+#
+# 완료 전 세그먼트는 메모리(및 미완료 multipart upload)에만 있으므로 프로세스가 비정상 종료되면
+# 최대 max_age초의 원시 데이터가 아카이브에서 빠질 수 있습니다 (DB에는 저장됨).
+# 업로드나 manifest 갱신에 실패한 세그먼트는 버리지 않고 보관하여, 다음 flush_expired 호출 때
+# 이미 올린 part 다음부터 이어서 다시 시도합니다 (S3 장애 동안에는 해당 세그먼트만큼 메모리를 더 사용).
+# 미완료 multipart upload는 버킷 lifecycle 규칙(AbortIncompleteMultipartUpload)으로 정리하세요.
+
+MB = 1024 * 1024
+MIN_PART_SIZE = 5 * MB  # S3 multipart upload의 최소 part 크기 (마지막 part 제외)
+
+
+class Segment:
+    def __init__(self, hour_key: str, key: str, fmt: str):
+        self.hour_key = hour_key
+        self.key = key
+        self.fmt = fmt
+        self.created = time.time()
+        self.buffer = bytearray()  # 아직 업로드하지 않은 압축 데이터
+        self.rows: List[Dict[str, Any]] = []  # parquet: 완료 시 한 번에 변환
+        self.upload_id: Optional[str] = None
+        self.parts: List[Dict[str, Any]] = []
+        self.num_record = 0
+        self.raw_bytes = 0
+        self.size = 0
+        self.min_time: Optional[str] = None
+        self.max_time: Optional[str] = None
+        self.sealed = False  # 압축 스트림 종료(또는 parquet 변환) 후에는 더 쓰지 않음
+        self.uploaded = False  # 객체 저장 완료, manifest 갱신만 남음
+        if fmt == 'jsonl':
+            self.compressor = zstandard.ZstdCompressor(level=3).compressobj() if zstandard is not None \
+                else zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: gzip 형식
+
+
+class ArchiveWriter:
+    def __init__(self, s3_client, bucket: str, prefix: str = 'ev_data', fmt: str = 'jsonl',
+                 segment_bytes: int = 512 * MB, max_age: float = 300, part_size: int = 8 * MB, name: str = None):
+        if fmt == 'parquet' and pa is None:
+            raise ValueError("parquet 형식에는 pyarrow가 필요합니다.")
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.fmt = fmt
+        self.segment_bytes = segment_bytes
+        self.max_age = max_age
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self.name = name or socket.gethostname()
+        self.ext = 'parquet' if fmt == 'parquet' else ('jsonl.zst' if zstandard is not None else 'jsonl.gz')
+        self.lock = threading.Lock()
+        self.segments: Dict[str, Segment] = {}
+        self.retry: List[Segment] = []  # 완료에 실패하여 다음 주기에 다시 시도할 세그먼트
+        self.manifests: Dict[str, List[Dict[str, Any]]] = {}
+        self.seq = 0
+
+    def add(self, records: List[Tuple[Any, datetime]]):
+        """(Pydantic 데이터, record_time) 레코드를 시간대별 세그먼트에 추가합니다."""
+        with self.lock:
+            for data, record_time in records:
+                hour_key = record_time.strftime("%Y-%m-%d-%H")
+                segment = self.segments.get(hour_key) or self._open(hour_key)
+                self._write(segment, data.model_dump(), record_time.isoformat())
+                if segment.raw_bytes >= self.segment_bytes:
+                    self._close(segment)
+
+    def flush_expired(self):
+        """max_age초가 지난 세그먼트를 완료합니다 (주기적으로 호출)."""
+        with self.lock:
+            for segment in list(self.retry):
+                self._close(segment)
+            now = time.time()
+            for segment in list(self.segments.values()):
+                if now - segment.created >= self.max_age:
+                    self._close(segment)
+
+    def close(self):
+        """모든 세그먼트를 완료합니다 (앱 종료 시)."""
+        with self.lock:
+            for segment in list(self.retry) + list(self.segments.values()):
+                self._close(segment)
+            for segment in self.retry:
+                print(f"❌ 아카이브 세그먼트 유실 ({segment.key}, {segment.num_record}건)")
+
+    def _open(self, hour_key: str) -> Segment:
+        key = f"{self.prefix}/{hour_key}/{self.name}_{datetime.now().strftime('%Y%m%d%H%M%S')}_{self.seq:06d}.{self.ext}"
+        self.seq += 1
+        segment = self.segments[hour_key] = Segment(hour_key, key, self.fmt)
+        return segment
+
+    def _write(self, segment: Segment, record: Dict[str, Any], record_time: str):
+        segment.num_record += 1
+        segment.min_time = record_time if segment.min_time is None else min(segment.min_time, record_time)
+        segment.max_time = record_time if segment.max_time is None else max(segment.max_time, record_time)
+        line = json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n'
+        segment.raw_bytes += len(line)
+        if segment.fmt == 'parquet':
+            segment.rows.append(record)
+            return
+        segment.buffer += segment.compressor.compress(line)
+        if len(segment.buffer) >= self.part_size:
+            try:
+                self._upload_part(segment, self.part_size)
+            except Exception as e:  # 다음 part 업로드 시 다시 시도
+                print(f"❌ 아카이브 part 업로드 실패 ({segment.key}): {e}")
+
+    def _upload_part(self, segment: Segment, size: int):
+        if segment.upload_id is None:
+            segment.upload_id = self.s3_client.create_multipart_upload(Bucket=self.bucket, Key=segment.key)['UploadId']
+        body = bytes(segment.buffer[:size])
+        response = self.s3_client.upload_part(Bucket=self.bucket, Key=segment.key, UploadId=segment.upload_id,
+                                              PartNumber=len(segment.parts) + 1, Body=body)
+        segment.parts.append({'PartNumber': len(segment.parts) + 1, 'ETag': response['ETag']})
+        del segment.buffer[:size]
+        segment.size += size
+
+    def _close(self, segment: Segment):
+        """세그먼트를 완료합니다. 실패하면 세그먼트를 보관하여 다음 flush_expired 호출 때 다시 시도합니다."""
+        if self.segments.get(segment.hour_key) is segment:
+            del self.segments[segment.hour_key]  # 이후 레코드는 새 세그먼트에 기록
+        try:
+            self._upload(segment)
+            self._update_manifest(segment)
+        except Exception as e:
+            print(f"❌ 아카이브 세그먼트 저장 실패, 다음 주기에 다시 시도 ({segment.key}, {segment.num_record}건): {e}")
+            if segment not in self.retry:
+                self.retry.append(segment)
+            return
+        if segment in self.retry:
+            self.retry.remove(segment)
+
+    def _upload(self, segment: Segment):
+        if segment.uploaded:
+            return
+        if not segment.sealed:
+            if segment.fmt == 'parquet':
+                buf = io.BytesIO()
+                pq.write_table(pa.Table.from_pylist(segment.rows), buf, compression='zstd')
+                segment.buffer += buf.getvalue()
+                segment.rows = []
+            else:
+                segment.buffer += segment.compressor.flush()
+            segment.sealed = True
+
+        if segment.upload_id is None and len(segment.buffer) < self.part_size:
+            # 작은 세그먼트는 PUT 한 번으로 저장
+            self.s3_client.put_object(Bucket=self.bucket, Key=segment.key, Body=bytes(segment.buffer))
+            segment.size += len(segment.buffer)
+        else:
+            # 실패한 경우 이미 올린 part는 유지되고, 남은 버퍼부터 이어서 업로드
+            while len(segment.buffer) >= self.part_size + MIN_PART_SIZE:
+                self._upload_part(segment, self.part_size)
+            if segment.buffer:
+                self._upload_part(segment, len(segment.buffer))  # 마지막 part는 5MB 미만이어도 됨
+            self.s3_client.complete_multipart_upload(Bucket=self.bucket, Key=segment.key, UploadId=segment.upload_id,
+                                                     MultipartUpload={'Parts': segment.parts})
+        segment.uploaded = True
+        segment.buffer = bytearray()
+        print(f"💾 원시 데이터 세그먼트 저장: s3://{self.bucket}/{segment.key} ({segment.num_record}건, {segment.size}B)")
+
+    def _update_manifest(self, segment: Segment):
+        """해당 시간대의 이 호스트 세그먼트 목록을 갱신합니다 (레플리카마다 별도 manifest). 실패 시 예외를 발생시킵니다."""
+        manifest_key = f"{self.prefix}/{segment.hour_key}/_manifest/{self.name}.json"
+        entries = self.manifests.get(segment.hour_key)
+        if entries is None:
+            entries = self._load_manifest(manifest_key)
+            self.manifests[segment.hour_key] = entries
+            # 최근 48개 시간대의 manifest만 메모리에 유지
+            for hour_key in sorted(self.manifests)[:-48]:
+                del self.manifests[hour_key]
+        if any(entry['key'] == segment.key for entry in entries):
+            entries[:] = [entry for entry in entries if entry['key'] != segment.key]  # 재시도: 중복 기록하지 않음
+        entries.append({
+            'key': segment.key,
+            'format': self.ext,
+            'records': segment.num_record,
+            'bytes': segment.size,
+            'raw_bytes': segment.raw_bytes,
+            'min_time': segment.min_time,
+            'max_time': segment.max_time,
+        })
+        self.s3_client.put_object(Bucket=self.bucket, Key=manifest_key, ContentType='application/json',
+                                  Body=json.dumps({'segments': entries}, ensure_ascii=False).encode('utf-8'))
+
+    def _load_manifest(self, manifest_key: str) -> List[Dict[str, Any]]:
+        # 같은 호스트명으로 재시작한 경우 기존 목록에 이어서 기록. 일시적인 오류(연결 실패 등)에 빈 목록으로
+        # 덮어쓰지 않도록 manifest가 없는 경우가 아니면 예외를 발생시켜 다음 주기에 다시 시도합니다.
+        try:
+            body = self.s3_client.get_object(Bucket=self.bucket, Key=manifest_key)['Body'].read()
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('NoSuchKey', '404'):
+                return []
+            raise
+        try:
+            return list(json.loads(body)['segments'])
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"⚠️ manifest를 읽을 수 없어 새로 작성합니다 ({manifest_key}): {e}")
+            return []
@@ -1,7 +1,7 @@
 # database.py
 
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
@@ -36,6 +36,18 @@ def create_db_tables():
     Base.metadata.create_all(bind=engine)
     print("✅ 데이터베이스 테이블 생성이 완료되었습니다 (이미 존재하면 건너뜀).")
 
+    # 유니크 인덱스 이전에 생성된 테이블에도 중복 방지 인덱스를 추가합니다.
+    # 이미 중복 레코드가 있으면 생성에 실패하므로, 중복을 정리한 뒤 다시 시작해야 합니다.
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(
+                "CREATE UNIQUE INDEX IF NOT EXISTS uq_vehicle_realtime_data_vin_record_time "
+                "ON vehicle_realtime_data (vin, record_time)"
+            ))
+    except Exception as e:
+        print(f"❌ 중복 방지 인덱스 생성 실패 (중복 레코드 정리 필요): {e}")
+        raise
+
 def get_db():
     """FastAPI Dependency Injection을 위한 DB 세션 생성 및 해제 제너레이터입니다."""
     db = SessionLocal()
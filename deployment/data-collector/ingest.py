@@ -0,0 +1,151 @@
+# ingest.py
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, List
+
+# ==============================================================================
+# 마이크로 배치 수집 버퍼
+# ==============================================================================
+# 요청 처리(이벤트 루프)와 저장(DB/S3, 블로킹 I/O)을 분리합니다.
+# - 요청은 레코드를 메모리 버퍼에 넣고 곧바로 응답합니다.
+# - 별도 태스크가 INGEST_BATCH_SIZE개 또는 INGEST_MAX_DELAY초마다 버퍼를 비우고,
+#   flush_func(batch)를 워커 스레드에서 실행하여 이벤트 루프를 막지 않습니다.
+# - flush_func가 예외를 발생시키면 배치 전체를 재시도하고, 레코드별 오류 목록(성공한 레코드는 None)을
+#   반환하면 해당 레코드만 실패로 처리합니다 (잘못된 레코드 하나가 배치 전체를 실패시키지 않도록).
+#
+# 전달 보장 (INGEST_ACK):
+# - "buffered": 버퍼에 들어가면 202로 응답합니다. 저장 전에 프로세스가 종료되면
+#   버퍼의 레코드는 유실될 수 있습니다 (at-most-once). 정상 종료 시에는 남은 버퍼를 저장합니다.
+# - "durable": 레코드가 포함된 배치가 DB에 커밋된 후 200으로 응답합니다. 저장 실패 시 503을 반환하므로
+#   전송 측이 재전송하면 at-least-once이며, (vin, record_time) 중복 제거로 중복 저장은 되지 않습니다.
+
+class RecentKeys:
+    """
+    최근 수신한 (vin, record_time) 키의 LRU 캐시입니다.
+    재전송된 레코드를 DB에 보내기 전에 걸러냅니다. 다른 레플리카로 간 재전송은 DB 유니크 인덱스가 막습니다.
+    """
+    def __init__(self, maxsize: int = 100000):
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self.keys: OrderedDict = OrderedDict()
+
+    def add(self, key: Hashable) -> bool:
+        """처음 본 키이면 추가하고 True, 최근에 본 키이면 False를 반환합니다."""
+        with self.lock:
+            if key in self.keys:
+                self.keys.move_to_end(key)
+                return False
+            self.keys[key] = None
+            if len(self.keys) > self.maxsize:
+                self.keys.popitem(last=False)
+            return True
+
+    def discard(self, key: Hashable):
+        """저장에 실패한 레코드의 키를 지워 재전송을 받을 수 있게 합니다."""
+        with self.lock:
+            self.keys.pop(key, None)
+
+
+class BufferFull(Exception):
+    """버퍼가 가득 찬 경우 (저장이 수신 속도를 따라가지 못함)"""
+
+
+class IngestBuffer:
+    def __init__(self, flush_func: Callable[[List[Any]], Any], max_batch: int = 1000, max_delay: float = 0.5,
+                 max_buffer: int = 100000, max_retry: int = 3):
+        self.flush_func = flush_func
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_retry = max_retry
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_buffer)
+        self.task = None
+        self.num_flushed = 0
+        self.num_failed = 0
+
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    async def put(self, record: Any, wait: bool = False):
+        """레코드를 버퍼에 넣습니다. wait=True이면 해당 배치의 저장이 끝날 때까지 기다립니다."""
+        future = asyncio.get_running_loop().create_future() if wait else None
+        try:
+            self.queue.put_nowait((record, future))
+        except asyncio.QueueFull:
+            raise BufferFull()
+        if future is not None:
+            await future
+
+    async def put_many(self, records: List[Any], wait: bool = False) -> List[Any]:
+        """
+        여러 레코드를 한 번에 버퍼에 넣습니다. 버퍼에 모두 들어갈 자리가 없으면 하나도 넣지 않습니다.
+        wait=True이면 레코드별 저장 결과(성공 시 None, 실패 시 예외)의 목록을 반환합니다.
+        """
+        if self.queue.maxsize > 0 and self.queue.qsize() + len(records) > self.queue.maxsize:
+            raise BufferFull()
+        loop = asyncio.get_running_loop()
+        futures = [loop.create_future() if wait else None for _ in records]
+        for record, future in zip(records, futures):
+            self.queue.put_nowait((record, future))
+        if not wait:
+            return [None] * len(records)
+        return await asyncio.gather(*futures, return_exceptions=True)
+
+    async def close(self):
+        """남은 레코드를 모두 저장한 뒤 저장 태스크를 종료합니다 (앱 종료 시)."""
+        if self.task is not None:
+            await self.queue.put(None)  # 종료 표시: 앞선 레코드가 모두 저장된 뒤 태스크가 끝납니다.
+            await self.task
+
+    async def _run(self):
+        closing = False
+        while not closing:
+            # 첫 레코드를 기다린 뒤, max_batch개가 모이거나 max_delay초가 지날 때까지 모읍니다.
+            batch = []
+            item = await self.queue.get()
+            deadline = time.monotonic() + self.max_delay
+            while item is not None:
+                batch.append(item)
+                if len(batch) >= self.max_batch:
+                    break
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            closing = item is None
+            if batch:
+                await self._flush(batch)
+
+    async def _flush(self, batch):
+        records = [record for record, _ in batch]
+        error = None
+        record_errors = None
+        for attempt in range(self.max_retry + 1):
+            try:
+                record_errors = await asyncio.to_thread(self.flush_func, records)
+                error = None
+                break
+            except Exception as e:
+                error = e
+                if attempt < self.max_retry:
+                    await asyncio.sleep(min(0.5 * 2 ** attempt, 10))
+
+        if error is not None:
+            print(f"❌ 배치 저장 실패 ({len(records)}건, {self.max_retry + 1}회 시도): {error}")
+            record_errors = [error] * len(records)
+        elif record_errors is None:
+            record_errors = [None] * len(records)
+        num_failed = sum(1 for e in record_errors if e is not None)
+        self.num_failed += num_failed
+        self.num_flushed += len(records) - num_failed
+        for (_, future), record_error in zip(batch, record_errors):
+            if future is not None and not future.done():
+                if record_error is None:
+                    future.set_result(None)
+                else:
+                    future.set_exception(record_error)
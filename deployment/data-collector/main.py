@@ -1,19 +1,26 @@
 # main.py
 
-from fastapi import FastAPI, HTTPException, Depends
-from sqlalchemy.orm import Session
-from datetime import datetime
+from fastapi import FastAPI, HTTPException, Request, Response
+import asyncio
+from pydantic import ValidationError
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import DataError, InterfaceError, OperationalError
+from datetime import datetime, timezone
 import json
 import os 
-from typing import Dict, Any # 타입 힌트 추가
+from typing import Dict, Any, List, Tuple # 타입 힌트 추가
 
 # S3 객체 저장을 위한 boto3 import
 import boto3
 from botocore.exceptions import NoCredentialsError, ClientError 
 
 # 로컬 모듈 import
-from database import get_db, create_db_tables
+from database import SessionLocal, create_db_tables, engine
+from archive import ArchiveWriter
+from ingest import BufferFull, IngestBuffer, RecentKeys
 from models import VehicleData, VehicleRealtimeData
+from partitions import PARTITION_RETENTION_DAYS, ensure_partitions, in_retention, maintain_partitions
+from wire import WireFormatError, decode_records
 
 # ==============================================================================
 # 🌟 S3 접속 정보 환경 변수 설정 🌟
@@ -29,6 +36,38 @@ S3_BUCKET_NAME = os.environ.get("S3_BUCKET_NAME", "sdv-ml-data")
 S3_ACCESS_KEY = os.environ.get("S3_ACCESS_KEY", "6A6NQZLGORPSM7IBWYM1")
 S3_SECRET_KEY = os.environ.get("S3_SECRET_KEY", "UarBUtVrfqdWANb5cZL3ZVbpAXj0I7JWIwAqzOxU")
 
+# ==============================================================================
+# 🌟 배치 수집 설정 (ingest.py 참고) 🌟
+# ==============================================================================
+
+# 응답 시점: "buffered" (버퍼 저장 후 202) 또는 "durable" (DB 커밋 후 200)
+INGEST_ACK = os.environ.get("INGEST_ACK", "buffered")
+
+# 배치 크기와 최대 대기 시간(초): 둘 중 먼저 도달하는 조건에서 저장
+INGEST_BATCH_SIZE = int(os.environ.get("INGEST_BATCH_SIZE", 1000))
+INGEST_MAX_DELAY = float(os.environ.get("INGEST_MAX_DELAY", 0.5))
+
+# 버퍼 최대 레코드 수: 초과 시 503을 반환하여 전송 측이 재시도하도록 함
+INGEST_MAX_BUFFER = int(os.environ.get("INGEST_MAX_BUFFER", 100000))
+
+# 재전송 레코드를 DB 전에 걸러내는 최근 키 캐시 크기 (0이면 사용하지 않음)
+RECENT_KEYS_SIZE = int(os.environ.get("RECENT_KEYS_SIZE", 100000))
+
+# INSERT 한 문장에 넣는 최대 행 수 (PostgreSQL 파라미터 수 제한 65535 이내)
+INSERT_CHUNK_SIZE = 2000
+
+# 원시 데이터 아카이브 (archive.py 참고): 형식 jsonl 또는 parquet, 세그먼트 크기(압축 전 MB)와 최대 유지 시간(초)
+ARCHIVE_FORMAT = os.environ.get("ARCHIVE_FORMAT", "jsonl")
+ARCHIVE_SEGMENT_MB = int(os.environ.get("ARCHIVE_SEGMENT_MB", 512))
+ARCHIVE_MAX_AGE = float(os.environ.get("ARCHIVE_MAX_AGE", 300))
+
+# 파티션 생성/집계/보관 기간 정리 주기 (초)
+PARTITION_MAINTENANCE_PERIOD = float(os.environ.get("PARTITION_MAINTENANCE_PERIOD", 3600))
+
+# 일괄 수집 요청(/api/vehicle/realtime/batch)의 최대 레코드 수와 최대 본문 크기(압축 해제 후 MB)
+BATCH_MAX_RECORDS = int(os.environ.get("BATCH_MAX_RECORDS", 10000))
+BATCH_MAX_MB = int(os.environ.get("BATCH_MAX_MB", 64))
+
 # ==============================================================================
 
 app = FastAPI(
@@ -37,18 +76,42 @@ app = FastAPI(
 )
 
 # ==============================================================================
-# 1. 앱 시작 이벤트: 테이블 생성 및 S3 클라이언트 초기화
+# 1. 앱 시작/종료 이벤트: 테이블 생성, S3 클라이언트 및 수집 버퍼 초기화
 # ==============================================================================
 
-# S3 클라이언트를 전역 변수로 초기화
+# S3 클라이언트와 수집 버퍼를 전역 변수로 초기화
 s3_client = None
+ingest_buffer = None
+recent_keys = RecentKeys(RECENT_KEYS_SIZE) if RECENT_KEYS_SIZE > 0 else None
+maintenance_task = None
+archive_writer = None
+archive_task = None
+
+async def run_archive_flush():
+    """ARCHIVE_MAX_AGE가 지난 원시 데이터 세그먼트를 주기적으로 S3에 완료합니다."""
+    while True:
+        await asyncio.sleep(min(ARCHIVE_MAX_AGE / 10, 10))
+        try:
+            await asyncio.to_thread(archive_writer.flush_expired)
+        except Exception as e:
+            print(f"❌ 아카이브 세그먼트 완료 실패: {e}")
+
+async def run_partition_maintenance():
+    """PARTITION_MAINTENANCE_PERIOD초마다 파티션 관리를 수행합니다 (워커 스레드에서 실행)."""
+    while True:
+        await asyncio.sleep(PARTITION_MAINTENANCE_PERIOD)
+        try:
+            await asyncio.to_thread(maintain_partitions, engine)
+        except Exception as e:
+            print(f"❌ 파티션 관리 실패: {e}")
 
 @app.on_event("startup")
-def on_startup():
-    """애플리케이션 시작 시 DB 테이블 및 S3 클라이언트를 준비합니다."""
-    global s3_client
+async def on_startup():
+    """애플리케이션 시작 시 DB 테이블, S3 클라이언트 및 수집 버퍼를 준비합니다."""
+    global s3_client, ingest_buffer, maintenance_task, archive_writer, archive_task
     try:
         create_db_tables()
+        maintain_partitions(engine)  # 오늘/앞으로의 파티션이 있어야 저장이 DEFAULT 파티션으로 몰리지 않음
         
         # S3 클라이언트 초기화
         if not S3_ACCESS_KEY or not S3_SECRET_KEY:
@@ -62,114 +125,283 @@ def on_startup():
             verify=False # 자체 서명된 인증서를 사용하는 경우 (필요에 따라 제거 가능)
         )
         print(f"✅ S3 클라이언트 초기화 완료: {S3_ENDPOINT_URL}")
+        archive_writer = ArchiveWriter(s3_client, S3_BUCKET_NAME, fmt=ARCHIVE_FORMAT,
+                                       segment_bytes=ARCHIVE_SEGMENT_MB * 1024 * 1024, max_age=ARCHIVE_MAX_AGE)
         
     except Exception as e:
         print(f"❌ 데이터베이스/S3 클라이언트 준비 실패: {e}")
         # 실패 시 서버 시작을 중단할 수 있도록 예외를 다시 발생시킬 수 있습니다.
         raise e 
 
+    ingest_buffer = IngestBuffer(store_batch, max_batch=INGEST_BATCH_SIZE, max_delay=INGEST_MAX_DELAY,
+                                 max_buffer=INGEST_MAX_BUFFER)
+    ingest_buffer.start()
+    print(f"✅ 수집 버퍼 시작: 배치 {INGEST_BATCH_SIZE}건 / {INGEST_MAX_DELAY}초, 응답 방식 {INGEST_ACK}")
+    maintenance_task = asyncio.create_task(run_partition_maintenance())
+    archive_task = asyncio.create_task(run_archive_flush())
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    """종료 시 버퍼에 남은 레코드를 저장합니다."""
+    if maintenance_task is not None:
+        maintenance_task.cancel()
+    if ingest_buffer is not None:
+        await ingest_buffer.close()
+        print(f"✅ 수집 버퍼 종료: 저장 {ingest_buffer.num_flushed}건, 실패 {ingest_buffer.num_failed}건")
+    if archive_task is not None:
+        archive_task.cancel()
+    if archive_writer is not None:
+        await asyncio.to_thread(archive_writer.close)
+
 # ==============================================================================
-# 2. 유틸리티: 원시 데이터 S3 저장 함수 수정
+# 2. 유틸리티: DB 일괄 저장 및 원시 데이터 아카이브
 # ==============================================================================
 
-def save_raw_data(data: VehicleData, record_time: datetime):
+def to_row(data: VehicleData, record_dt: datetime) -> Dict[str, Any]:
+    """Pydantic 데이터를 vehicle_realtime_data 테이블의 한 행으로 변환합니다."""
+    return {
+        "record_time": record_dt,
+        "vin": data.vin,
+        "state_changed": data.stateChanged,
+        "car_state": None if data.car_data.state is None else str(data.car_data.state),
+        "soc": data.car_data.soc,
+        "speed": data.car_data.speed,
+        "total_volt": data.car_data.totalVolt,
+        "total_ampere": data.car_data.totalAmpere,
+        "longitude": data.location_data.longitude,
+        "latitude": data.location_data.latitude,
+        "max_volt": data.extremeValue_data.batteryMaxVolt,
+        "min_volt": data.extremeValue_data.batteryMinVolt,
+        "max_temp": data.extremeValue_data.batteryMaxTemp,
+        "min_temp": data.extremeValue_data.batteryMinTemp,
+    }
+
+def parse_record_time(time_str: str) -> datetime:
+    """'time' 문자열을 datetime으로 변환합니다. 시간대가 없으면 UTC로 간주합니다 (DB에서 돌려받은 시각과 같은 키로 비교하기 위함)."""
+    record_dt = datetime.fromisoformat(time_str.replace('Z', '+00:00'))
+    if record_dt.tzinfo is None:
+        record_dt = record_dt.replace(tzinfo=timezone.utc)
+    return record_dt
+
+def describe_error(e: Exception) -> str:
+    """레코드 검증 오류를 응답에 넣을 짧은 문자열로 변환합니다."""
+    if isinstance(e, ValidationError):
+        return "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+    return str(e)
+
+def insert_records(db, records: List[Tuple[VehicleData, datetime]]) -> List[Tuple[VehicleData, datetime]]:
     """
-    수신된 Pydantic 데이터를 JSON 파일로 변환하여 Rook-Ceph RGW(S3)에 업로드합니다.
+    INSERT ... ON CONFLICT DO NOTHING으로 저장하고 새로 저장된 레코드를 반환합니다 (커밋은 호출하는 쪽에서).
+    중복 확인은 유니크 인덱스가 INSERT와 함께 처리하므로 별도 SELECT가 없습니다.
     """
-    if s3_client is None:
-        print("❌ S3 클라이언트가 초기화되지 않았습니다. 저장 실패.")
-        return False
-        
-    try:
-        # S3 키(경로/파일명) 형식: ev_data/[YYYY]/[MM]/[DD]/[HH]/[VIN]_[TIME].json
-        # Object Key 생성 (파티셔닝 구조를 고려)
-        key_format = record_time.strftime("%Y-%m-%d-%H")
-        timestamp_str = record_time.strftime("%Y%m%d%H%M%S_%f")
-        object_key = f"ev_data/{key_format}/{data.vin}_{timestamp_str}.json"
-
-        # Pydantic 모델을 JSON 문자열(bytes)로 변환
-        json_data = json.dumps(data.model_dump(), indent=2, ensure_ascii=False).encode('utf-8')
-
-        # S3에 업로드
-        s3_client.put_object(
-            Bucket=S3_BUCKET_NAME,
-            Key=object_key,
-            Body=json_data,
-            ContentType='application/json'
+    inserted = set()
+    for start in range(0, len(records), INSERT_CHUNK_SIZE):
+        stmt = (
+            insert(VehicleRealtimeData)
+            .values([to_row(data, record_dt) for data, record_dt in records[start:start + INSERT_CHUNK_SIZE]])
+            .on_conflict_do_nothing(index_elements=["vin", "record_time"])
+            .returning(VehicleRealtimeData.vin, VehicleRealtimeData.record_time)
         )
+        inserted.update(tuple(row) for row in db.execute(stmt).all())
+    return [(data, record_dt) for data, record_dt in records if (data.vin, record_dt) in inserted]
 
-        print(f"💾 원시 데이터 S3 저장 성공: s3://{S3_BUCKET_NAME}/{object_key}")
-        return True
-        
-    except ClientError as e:
-        # S3 관련 오류 (예: 버킷 없음, 권한 거부 등)
-        print(f"❌ S3 Client 오류 발생: {e}")
-        return False
+def store_batch(records: List[Tuple[VehicleData, datetime]]) -> List[Any]:
+    """
+    배치 하나를 저장합니다 (워커 스레드에서 실행).
+    INSERT ... ON CONFLICT DO NOTHING 1회 + 커밋 1회. 원시 데이터는 아카이브 세그먼트에 추가됩니다.
+    배치 저장이 실패하면 레코드별로 다시 저장하여 잘못된 레코드 하나가 나머지 레코드를 실패시키지 않도록 하고,
+    레코드별 오류 목록(저장된 레코드는 None)을 반환합니다. 모든 레코드가 실패하면(DB 장애 등) 예외를 발생시켜
+    수집 버퍼가 배치 전체를 재시도합니다.
+    """
+    # 1. 배치 내 중복 제거 (VIN과 record_time이 같은 레코드는 첫 번째만 유지)
+    unique: Dict[Tuple[str, datetime], Tuple[VehicleData, datetime]] = {}
+    for data, record_dt in records:
+        unique.setdefault((data.vin, record_dt), (data, record_dt))
+
+    # 저장할 일자의 파티션을 먼저 만들어 늦게 도착한 과거 데이터가 DEFAULT 파티션에 쌓이지 않도록 합니다.
+    try:
+        ensure_partitions(engine, [record_dt for _, record_dt in unique.values()])
     except Exception as e:
-        print(f"❌ 원시 데이터 S3 저장 중 예상치 못한 오류: {e}")
-        return False
+        print(f"⚠️ 파티션 준비 실패, DEFAULT 파티션에 저장될 수 있습니다: {e}")
+
+    db = SessionLocal()
+    errors: Dict[Tuple[str, datetime], Exception] = {}
+    try:
+        # 2. DB 일괄 저장: 이미 저장된 (VIN, record_time)은 건너뛰고, 새로 저장된 레코드만 돌려받음
+        unique_records = list(unique.values())
+        try:
+            new_records = insert_records(db, unique_records)
+            db.commit()
+        except Exception as batch_error:
+            db.rollback()
+            if len(unique_records) == 1 or isinstance(batch_error, (OperationalError, InterfaceError)):
+                raise  # 연결 오류 등 DB 장애는 레코드와 무관하므로 배치 전체를 재시도
+            print(f"⚠️ 배치 저장 실패, 레코드별로 다시 저장합니다 ({len(unique_records)}건): {batch_error}")
+            new_records = []
+            for key, record in unique.items():
+                try:
+                    new_records += insert_records(db, [record])
+                    db.commit()
+                except (OperationalError, InterfaceError):
+                    db.rollback()
+                    raise
+                except Exception as e:
+                    db.rollback()
+                    errors[key] = e
+            if len(errors) == len(unique_records):
+                raise batch_error
+            print(f"❌ 저장 실패 레코드 {len(errors)}건: {next(iter(errors.values()))}")
+
+        num_duplicated = len(unique) - len(errors) - len(new_records)
+        if num_duplicated > 0:
+            print(f"⚠️ 중복 데이터 무시: {num_duplicated}건")
+
+        # 3. 새로 저장된 레코드의 원시 데이터를 아카이브 세그먼트에 추가 (S3 업로드는 세그먼트 단위)
+        # 아카이브 오류는 이미 커밋된 DB 저장에 영향을 주지 않도록 기록만 합니다.
+        if new_records:
+            try:
+                archive_writer.add(new_records)
+            except Exception as e:
+                print(f"❌ 원시 데이터 아카이브 추가 실패 ({len(new_records)}건): {e}")
+        print(f"💾 배치 저장 성공: {len(new_records)}건")
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    return [errors.get((data.vin, record_dt)) for data, record_dt in records]
 
 # ==============================================================================
-# 3. API 엔드포인트 (로직은 동일하며, 파일 저장 호출만 S3 저장으로 대체)
+# 3. API 엔드포인트: 검증 후 수집 버퍼에 넣고 바로 응답
 # ==============================================================================
 
 @app.post('/api/vehicle/realtime')
 async def receive_vehicle_data(
     data: VehicleData, 
-    db: Session = Depends(get_db)
+    response: Response
 ):
-    """데이터 수신, 중복 확인 후 DB 저장 및 원시 데이터 S3 저장을 처리합니다."""
+    """데이터를 수신하여 수집 버퍼에 넣습니다. DB/S3 저장은 배치 단위로 수행됩니다."""
     
     # 1. 'time' 문자열을 datetime 객체로 변환
     try:
-        record_dt = datetime.fromisoformat(data.time.replace('Z', '+00:00'))
+        record_dt = parse_record_time(data.time)
     except ValueError:
         raise HTTPException(status_code=422, detail="잘못된 'time' 형식입니다.")
+    if not in_retention(record_dt):
+        raise HTTPException(status_code=422, detail=f"보관 기간({PARTITION_RETENTION_DAYS}일)보다 오래된 데이터입니다.")
 
-    # 2. 중복 데이터 확인 (VIN과 record_time이 모두 일치하는 레코드가 있는지 확인)
-    exists = db.query(VehicleRealtimeData.id).filter(
-        VehicleRealtimeData.vin == data.vin,
-        VehicleRealtimeData.record_time == record_dt
-    ).first()
-
-    if exists:
-        print(f"⚠️ 중복 데이터 무시: VIN={data.vin}, Time={data.time}. 이미 저장되었습니다.")
+    # 2. 최근에 수신한 레코드의 재전송은 DB에 보내지 않고 무시
+    key = (data.vin, record_dt)
+    if recent_keys is not None and not recent_keys.add(key):
         return {"message": "중복 데이터, 무시됨", "vin": data.vin}
 
-    # 3. 원시 데이터 S3 저장 (DB 저장 시도 전에 수행)
-    # S3 저장이 실패하더라도 DB 저장은 시도하도록 예외를 잡고 처리합니다.
-    save_raw_data(data, record_dt) 
+    # 3. 버퍼에 저장 (durable 모드에서는 배치가 커밋될 때까지 대기)
+    durable = INGEST_ACK == "durable"
+    try:
+        await ingest_buffer.put((data, record_dt), wait=durable)
+    except BufferFull:
+        if recent_keys is not None:
+            recent_keys.discard(key)
+        raise HTTPException(status_code=503, detail="수집 버퍼가 가득 찼습니다. 잠시 후 다시 전송하세요.",
+                            headers={"Retry-After": "1"})
+    except DataError as e:
+        # 컬럼에 맞지 않는 값 등 재전송해도 저장할 수 없는 레코드
+        if recent_keys is not None:
+            recent_keys.discard(key)
+        raise HTTPException(status_code=422, detail=f"저장할 수 없는 데이터: {e.orig}")
+    except Exception as e:
+        if recent_keys is not None:
+            recent_keys.discard(key)
+        raise HTTPException(status_code=503, detail=f"데이터베이스 저장 오류: {e}")
+
+    if durable:
+        return {"message": "데이터 수신 및 DB 저장 성공", "vin": data.vin}
+    response.status_code = 202
+    return {"message": "데이터 수신 완료 (배치 저장 대기)", "vin": data.vin}
 
-    # 4. DB 저장
+@app.post('/api/vehicle/realtime/batch')
+async def receive_vehicle_data_batch(
+    request: Request,
+    response: Response
+):
+    """
+    여러 레코드를 한 요청으로 수신합니다 (오프라인 동안 버퍼링한 엣지 디바이스용).
+    JSON 배열, NDJSON, msgpack 본문과 gzip/zstd 압축을 지원합니다 (wire.py 참고).
+    레코드별 검증 후 유효한 레코드를 한 번에 수집 버퍼에 넣고, 요청 순서대로 레코드별 상태를 반환합니다.
+      accepted: 버퍼에 저장됨 (buffered) / stored: DB 저장 완료 (durable)
+      duplicate: 이미 수신한 레코드 / invalid: 검증 실패 (재전송 불필요) / failed: 저장 실패 (재전송 필요)
+    """
+    max_bytes = BATCH_MAX_MB * 1024 * 1024
+    body = await request.body()
+    if len(body) > max_bytes:
+        raise HTTPException(status_code=413, detail=f"본문이 {BATCH_MAX_MB}MB를 넘습니다.")
+
+    # 1. 본문 디코딩 (압축 해제/파싱은 CPU 작업이므로 워커 스레드에서 실행)
     try:
-        # DB 저장 로직은 이전과 동일
-        new_record = VehicleRealtimeData(
-            record_time=record_dt,
-            vin=data.vin,
-            state_changed=data.stateChanged,
-            car_state=data.car_data.state,
-            soc=data.car_data.soc,
-            speed=data.car_data.speed,
-            total_volt=data.car_data.totalVolt,
-            total_ampere=data.car_data.totalAmpere,
-            longitude=data.location_data.longitude,
-            latitude=data.location_data.latitude,
-            max_volt=data.extremeValue_data.batteryMaxVolt,
-            min_volt=data.extremeValue_data.batteryMinVolt,
-            max_temp=data.extremeValue_data.batteryMaxTemp,
-            min_temp=data.extremeValue_data.batteryMinTemp,
-        )
-        
-        db.add(new_record)
-        db.commit()
-        db.refresh(new_record)
+        raw_records = await asyncio.to_thread(decode_records, body, request.headers.get("content-type"),
+                                              request.headers.get("content-encoding"), max_bytes)
+    except WireFormatError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    if len(raw_records) > BATCH_MAX_RECORDS:
+        raise HTTPException(status_code=413, detail=f"한 요청의 레코드는 최대 {BATCH_MAX_RECORDS}건입니다.")
 
-        return {"message": "데이터 수신 및 DB 저장 성공", "vin": new_record.vin, "id": new_record.id}
-        
-    except Exception as e:
-        db.rollback() 
-        print(f"❌ DB 저장 오류 발생: {e}")
-        raise HTTPException(status_code=500, detail=f"데이터베이스 저장 오류: {e}")
+    # 2. 레코드별 검증 및 중복 확인
+    statuses: List[str] = []
+    errors: List[Dict[str, Any]] = []
+    accepted: List[Tuple[int, Tuple[str, datetime], Tuple[VehicleData, datetime]]] = []
+    batch_keys = set()
+    for i, raw in enumerate(raw_records):
+        try:
+            if isinstance(raw, Exception):
+                raise raw
+            data = VehicleData.model_validate(raw)
+            record_dt = parse_record_time(data.time)
+            if not in_retention(record_dt):
+                raise ValueError(f"보관 기간({PARTITION_RETENTION_DAYS}일)보다 오래된 데이터입니다.")
+        except (ValueError, WireFormatError) as e:
+            statuses.append("invalid")
+            errors.append({"index": i, "error": describe_error(e)})
+            continue
+        key = (data.vin, record_dt)
+        if key in batch_keys or (recent_keys is not None and not recent_keys.add(key)):
+            statuses.append("duplicate")
+            continue
+        batch_keys.add(key)
+        statuses.append("accepted")
+        accepted.append((i, key, (data, record_dt)))
+
+    # 3. 유효한 레코드를 한 번에 버퍼에 저장 (durable 모드에서는 레코드가 포함된 배치들이 커밋될 때까지 대기)
+    durable = INGEST_ACK == "durable"
+    if accepted:
+        try:
+            outcomes = await ingest_buffer.put_many([record for _, _, record in accepted], wait=durable)
+        except BufferFull:
+            if recent_keys is not None:
+                for _, key, _ in accepted:
+                    recent_keys.discard(key)
+            raise HTTPException(status_code=503, detail="수집 버퍼가 가득 찼습니다. 잠시 후 다시 전송하세요.",
+                                headers={"Retry-After": "1"})
+        for (i, key, _), outcome in zip(accepted, outcomes):
+            if isinstance(outcome, DataError):
+                statuses[i] = "invalid"
+                errors.append({"index": i, "error": f"저장할 수 없는 데이터: {outcome.orig}"})
+                if recent_keys is not None:
+                    recent_keys.discard(key)
+            elif isinstance(outcome, Exception):
+                statuses[i] = "failed"
+                errors.append({"index": i, "error": f"데이터베이스 저장 오류: {outcome}"})
+                if recent_keys is not None:
+                    recent_keys.discard(key)
+            elif durable:
+                statuses[i] = "stored"
+
+    counts: Dict[str, int] = {}
+    for status in statuses:
+        counts[status] = counts.get(status, 0) + 1
+    if not durable:
+        response.status_code = 202
+    errors.sort(key=lambda error: error["index"])
+    return {"total": len(statuses), "counts": counts, "statuses": statuses, "errors": errors}
 
 # ==============================================================================
 # 4. Uvicorn 실행 (로컬 테스트용)
@@ -0,0 +1,90 @@
+# models.py
+
+from typing import Optional, Union
+
+from pydantic import BaseModel, ConfigDict, Field, field_validator
+from sqlalchemy import BigInteger, Boolean, Column, DateTime, Float, Identity, Index, String, func
+
+from database import Base
+
+# ==============================================================================
+# 1. 수신 데이터 (Pydantic) 모델: can-data-sender의 전송 형식
+# ==============================================================================
+
+class CarData(BaseModel):
+    model_config = ConfigDict(extra='allow')
+
+    state: Optional[Union[int, str]] = None  # car_state 컬럼(String(32))에 str(state)로 저장
+    soc: Optional[float] = None
+    speed: Optional[float] = None
+    totalVolt: Optional[float] = None
+    totalAmpere: Optional[float] = None
+
+    @field_validator('state')
+    @classmethod
+    def check_state_length(cls, value):
+        # 컬럼보다 긴 값은 배치 INSERT 전체를 실패시키므로 수신 시점에 거부 (422)
+        if value is not None and len(str(value)) > 32:
+            raise ValueError('state는 32자 이하여야 합니다.')
+        return value
+
+class LocationData(BaseModel):
+    model_config = ConfigDict(extra='allow')
+
+    longitude: Optional[float] = None
+    latitude: Optional[float] = None
+
+class ExtremeValueData(BaseModel):
+    model_config = ConfigDict(extra='allow')
+
+    batteryMaxVolt: Optional[float] = None
+    batteryMinVolt: Optional[float] = None
+    batteryMaxTemp: Optional[float] = None
+    batteryMinTemp: Optional[float] = None
+
+class VehicleData(BaseModel):
+    # DB에 저장하지 않는 필드(powerBatteryInfoSet_data 등)도 원시 데이터로 S3에 저장되도록 유지
+    model_config = ConfigDict(extra='allow')
+
+    time: str
+    vin: str = Field(max_length=32)  # vin 컬럼(String(32))보다 긴 값은 422로 거부
+    stateChanged: Optional[bool] = None
+    car_data: CarData = CarData()
+    location_data: LocationData = LocationData()
+    extremeValue_data: ExtremeValueData = ExtremeValueData()
+
+# ==============================================================================
+# 2. DB (SQLAlchemy) 모델
+# ==============================================================================
+
+class VehicleRealtimeData(Base):
+    # record_time 기준 일 단위 RANGE 파티션 테이블 (파티션 생성/삭제는 partitions.py)
+    # 파티션 테이블의 기본 키와 유니크 인덱스에는 파티션 키(record_time)가 포함되어야 합니다.
+    __tablename__ = "vehicle_realtime_data"
+
+    id = Column(BigInteger, Identity(), primary_key=True)
+    record_time = Column(DateTime(timezone=True), primary_key=True, nullable=False)
+    vin = Column(String(32), nullable=False)
+    state_changed = Column(Boolean)
+    car_state = Column(String(32))
+    soc = Column(Float)
+    speed = Column(Float)
+    total_volt = Column(Float)
+    total_ampere = Column(Float)
+    longitude = Column(Float)
+    latitude = Column(Float)
+    max_volt = Column(Float)
+    min_volt = Column(Float)
+    max_temp = Column(Float)
+    min_temp = Column(Float)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    # 중복 방지: 같은 VIN과 record_time의 레코드는 하나만 저장 (INSERT ... ON CONFLICT DO NOTHING)
+    # 여러 레플리카가 동시에 저장해도 DB가 중복을 막습니다.
+    # 이 인덱스는 "VIN 하나의 기간 조회"에도 사용되고, 기간 조건은 파티션 프루닝으로 해당 일자만 읽습니다.
+    # BRIN 인덱스: 시간순으로 쌓이는 데이터의 전체 VIN 기간 조회용 (B-tree 대비 수백 분의 1 크기)
+    __table_args__ = (
+        Index("uq_vehicle_realtime_data_vin_record_time", "vin", "record_time", unique=True),
+        Index("brin_vehicle_realtime_data_record_time", "record_time", postgresql_using="brin"),
+        {"postgresql_partition_by": "RANGE (record_time)"},
+    )
@@ -0,0 +1,176 @@
+# partitions.py
+
+import os
+import re
+from datetime import date, datetime, timedelta, timezone
+
+from sqlalchemy import text
+
+from models import VehicleRealtimeData
+
+# ==============================================================================
+# 🌟 파티션 관리 설정 🌟
+# ==============================================================================
+
+# 미리 만들어 둘 일 단위 파티션 수 (오늘 이후)
+PARTITION_PRECREATE_DAYS = int(os.environ.get("PARTITION_PRECREATE_DAYS", 3))
+
+# 보관 기간(일): 이보다 오래된 일 단위 파티션은 삭제 (0이면 삭제하지 않음)
+PARTITION_RETENTION_DAYS = int(os.environ.get("PARTITION_RETENTION_DAYS", 90))
+
+# 시간 단위 집계 테이블 (파티션이 삭제된 뒤에도 VIN별 시간 단위 통계를 유지)
+ROLLUP_ENABLED = os.environ.get("ROLLUP_ENABLED", "1") == "1"
+
+# 집계 테이블의 테이블 액세스 메서드 (예: Citus/Hydra 확장의 "columnar", 비우면 일반 heap 테이블)
+ROLLUP_ACCESS_METHOD = os.environ.get("ROLLUP_ACCESS_METHOD", "")
+
+# 늦게 도착하는 데이터를 기다리는 시간(시간): 이 시간이 지난 구간만 집계
+ROLLUP_DELAY_HOURS = int(os.environ.get("ROLLUP_DELAY_HOURS", 1))
+
+# 여러 레플리카 중 하나만 관리 작업을 수행하도록 하는 advisory lock 키
+MAINTENANCE_LOCK_ID = 73100001
+
+TABLE = VehicleRealtimeData.__tablename__
+ROLLUP_TABLE = f"{TABLE}_hourly"
+PARTITION_PATTERN = re.compile(rf"^{TABLE}_p(\d{{8}})$")
+
+# ==============================================================================
+
+def partition_name(day: date) -> str:
+    return f"{TABLE}_p{day:%Y%m%d}"
+
+def is_partitioned(conn) -> bool:
+    relkind = conn.execute(text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:t)"), {"t": TABLE}).scalar()
+    return relkind == "p"
+
+def retention_cutoff(today: date, retention_days: int = PARTITION_RETENTION_DAYS):
+    """보관 기간의 첫 날(UTC). 보관 기간이 없으면(0) None."""
+    return today - timedelta(days=retention_days) if retention_days > 0 else None
+
+def in_retention(record_dt: datetime) -> bool:
+    """보관 기간 안의 레코드인지 확인합니다. 보관 기간보다 오래된 레코드는 저장해도 곧 삭제되므로 받지 않습니다."""
+    cutoff = retention_cutoff(datetime.now(timezone.utc).date())
+    return cutoff is None or record_dt.astimezone(timezone.utc).date() >= cutoff
+
+# 이 프로세스가 이미 만들었거나 확인한 일 단위 파티션
+known_days = set()
+
+def create_partition(conn, day: date) -> bool:
+    """
+    day의 일 단위 파티션을 만듭니다. DEFAULT 파티션에 이미 해당 일자의 데이터가 있으면 CREATE가 실패하므로,
+    새 테이블로 옮긴 뒤 파티션으로 연결합니다. 실패하면 False를 반환합니다 (해당 일자는 DEFAULT에 저장됨).
+    """
+    name = partition_name(day)
+    bounds = f"FROM ('{day} 00:00:00+00') TO ('{day + timedelta(days=1)} 00:00:00+00')"
+    try:
+        # 실패해도 호출한 쪽의 트랜잭션이 계속되도록 savepoint로 감쌉니다.
+        with conn.begin_nested():
+            conn.execute(text(f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {TABLE} FOR VALUES {bounds}"))
+        known_days.add(day)
+        return True
+    except Exception as e:
+        error = e
+    try:
+        with conn.begin_nested():
+            conn.execute(text(f"CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+            moved = conn.execute(text(
+                f"WITH moved AS (DELETE FROM {TABLE}_default WHERE record_time >= :since AND record_time < :until "
+                f"RETURNING *) INSERT INTO {name} SELECT * FROM moved"
+            ), {"since": f"{day} 00:00:00+00", "until": f"{day + timedelta(days=1)} 00:00:00+00"}).rowcount
+            conn.execute(text(f"ALTER TABLE {TABLE} ATTACH PARTITION {name} FOR VALUES {bounds}"))
+        print(f"📦 DEFAULT 파티션의 {day} 데이터 {moved}건을 {name}으로 옮겼습니다.")
+        known_days.add(day)
+        return True
+    except Exception as e:
+        print(f"❌ 파티션 생성 실패 ({name}): {error} / {e}")
+        return False
+
+def create_partitions(conn, today: date, days_ahead: int = PARTITION_PRECREATE_DAYS,
+                      retention_days: int = PARTITION_RETENTION_DAYS):
+    """
+    보관 기간의 첫 날(보관 기간이 없으면 어제)부터 days_ahead일 뒤까지의 일 단위(UTC) 파티션과,
+    범위 밖 데이터를 받는 DEFAULT 파티션을 만듭니다. 늦게 도착한 과거 데이터도 일 단위 파티션에 저장됩니다.
+    """
+    conn.execute(text(f"CREATE TABLE IF NOT EXISTS {TABLE}_default PARTITION OF {TABLE} DEFAULT"))
+    first_day = retention_cutoff(today, retention_days) or today - timedelta(days=1)
+    for offset in range((first_day - today).days, days_ahead + 1):
+        create_partition(conn, today + timedelta(days=offset))
+
+def ensure_partitions(engine, record_times):
+    """저장할 레코드의 일자 중 아직 확인하지 않은 일자의 파티션을 만듭니다 (배치 저장 전에 호출)."""
+    missing = {record_dt.astimezone(timezone.utc).date() for record_dt in record_times} - known_days
+    if not missing:
+        return
+    with engine.begin() as conn:
+        if not is_partitioned(conn):
+            known_days.update(missing)  # 이전 스키마: 파티션이 필요 없음
+            return
+        for day in sorted(missing):
+            create_partition(conn, day)
+
+def drop_partitions(conn, today: date, retention_days: int = PARTITION_RETENTION_DAYS):
+    """보관 기간이 지난 일 단위 파티션을 삭제하고 (DELETE 없이 파일 단위로 정리), DEFAULT 파티션에서도 지웁니다."""
+    cutoff = retention_cutoff(today, retention_days)
+    if cutoff is None:
+        return
+    children = conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(:t)"
+    ), {"t": TABLE}).scalars().all()
+    for name in sorted(children):
+        match = PARTITION_PATTERN.match(name)
+        if match and datetime.strptime(match.group(1), "%Y%m%d").date() < cutoff:
+            conn.execute(text(f"DROP TABLE IF EXISTS {name}"))
+            known_days.discard(datetime.strptime(match.group(1), "%Y%m%d").date())
+            print(f"🗑️ 보관 기간이 지난 파티션 삭제: {name}")
+    if f"{TABLE}_default" in children:
+        result = conn.execute(text(f"DELETE FROM {TABLE}_default WHERE record_time < :cutoff"),
+                              {"cutoff": f"{cutoff} 00:00:00+00"})
+        if result.rowcount:
+            print(f"🗑️ DEFAULT 파티션에서 보관 기간이 지난 데이터 삭제: {result.rowcount}건")
+
+def rollup_hours(conn, now: datetime, delay_hours: int = ROLLUP_DELAY_HOURS):
+    """
+    아직 집계하지 않은 완료된 시간 구간을 VIN별 시간 단위 통계로 추가합니다.
+    이미 집계한 구간은 다시 쓰지 않으므로 UPDATE를 지원하지 않는 columnar 테이블에도 사용할 수 있습니다.
+    """
+    using = f" USING {ROLLUP_ACCESS_METHOD}" if ROLLUP_ACCESS_METHOD else ""
+    conn.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {ROLLUP_TABLE} ("
+        "vin VARCHAR(32) NOT NULL, hour TIMESTAMPTZ NOT NULL, num_record INTEGER, "
+        "avg_soc DOUBLE PRECISION, min_soc DOUBLE PRECISION, avg_speed DOUBLE PRECISION, max_speed DOUBLE PRECISION, "
+        "min_volt DOUBLE PRECISION, max_volt DOUBLE PRECISION, min_temp DOUBLE PRECISION, max_temp DOUBLE PRECISION"
+        f"){using}"
+    ))
+    conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{ROLLUP_TABLE}_vin_hour ON {ROLLUP_TABLE} (vin, hour)"))
+
+    until = now.replace(minute=0, second=0, microsecond=0) - timedelta(hours=delay_hours)
+    since = conn.execute(text(f"SELECT max(hour) + interval '1 hour' FROM {ROLLUP_TABLE}")).scalar()
+    if since is None:
+        since = conn.execute(text(f"SELECT date_trunc('hour', min(record_time)) FROM {TABLE}")).scalar()
+    if since is None or since >= until:
+        return
+    result = conn.execute(text(
+        f"INSERT INTO {ROLLUP_TABLE} "
+        "SELECT vin, date_trunc('hour', record_time), count(*), avg(soc), min(soc), avg(speed), max(speed), "
+        "min(min_volt), max(max_volt), min(min_temp), max(max_temp) "
+        f"FROM {TABLE} WHERE record_time >= :since AND record_time < :until "
+        "GROUP BY 1, 2"
+    ), {"since": since, "until": until})
+    print(f"📊 시간 단위 집계 추가: {since} ~ {until}, {result.rowcount}행")
+
+def maintain_partitions(engine):
+    """파티션 생성, 집계, 보관 기간 정리를 한 번 수행합니다 (시작 시 및 주기적으로 호출)."""
+    now = datetime.now(timezone.utc)
+    with engine.begin() as conn:
+        # 다른 레플리카가 수행 중이면 건너뜀
+        if not conn.execute(text("SELECT pg_try_advisory_xact_lock(:id)"), {"id": MAINTENANCE_LOCK_ID}).scalar():
+            return
+        if not is_partitioned(conn):
+            print(f"⚠️ {TABLE}이 파티션 테이블이 아닙니다 (이전 스키마). 파티션 관리를 건너뜁니다.")
+            return
+        create_partitions(conn, now.date())
+        if ROLLUP_ENABLED:
+            # 파티션을 삭제하기 전에 집계하여 오래된 기간의 통계가 남도록 합니다.
+            rollup_hours(conn, now)
+        drop_partitions(conn, now.date())
@@ -0,0 +1,57 @@
+import gzip
+import json
+
+import pytest
+
+from wire import WireFormatError, decode_records
+
+
+def ndjson(records):
+    return b"".join(json.dumps(record).encode() + b"\n" for record in records)
+
+
+def test_gzip_multiple_members():
+    body = gzip.compress(ndjson([{"a": 1}])) + gzip.compress(ndjson([{"a": 2}, {"a": 3}]))
+    assert decode_records(body, "application/x-ndjson", "gzip", 1024) == [{"a": 1}, {"a": 2}, {"a": 3}]
+
+
+def test_gzip_members_with_trailing_padding():
+    body = gzip.compress(b'[{"a": 1},') + gzip.compress(b'{"a": 2}]') + b"\x00" * 8
+    assert decode_records(body, "application/json", "gzip", 1024) == [{"a": 1}, {"a": 2}]
+
+
+def test_gzip_max_bytes_across_members():
+    member = gzip.compress(ndjson([{"a": "x" * 100}]))
+    assert len(decode_records(member * 2, "application/x-ndjson", "gzip", 300)) == 2
+    with pytest.raises(WireFormatError) as exc_info:
+        decode_records(member * 3, "application/x-ndjson", "gzip", 300)
+    assert exc_info.value.status_code == 413
+
+
+def test_gzip_truncated_member():
+    body = gzip.compress(ndjson([{"a": 1}])) + gzip.compress(ndjson([{"a": 2}]))[:-6]
+    with pytest.raises(WireFormatError) as exc_info:
+        decode_records(body, "application/x-ndjson", "gzip", 1024)
+    assert exc_info.value.status_code == 400
+
+
+def test_zstd_multiple_frames():
+    zstandard = pytest.importorskip("zstandard")
+    compressor = zstandard.ZstdCompressor()
+    body = compressor.compress(ndjson([{"a": 1}])) + compressor.compress(ndjson([{"a": 2}, {"a": 3}]))
+    assert decode_records(body, "application/x-ndjson", "zstd", 1024) == [{"a": 1}, {"a": 2}, {"a": 3}]
+
+
+def test_zstd_max_bytes_across_frames():
+    zstandard = pytest.importorskip("zstandard")
+    frame = zstandard.ZstdCompressor().compress(ndjson([{"a": "x" * 100}]))
+    assert len(decode_records(frame * 2, "application/x-ndjson", "zstd", 300)) == 2
+    with pytest.raises(WireFormatError) as exc_info:
+        decode_records(frame * 3, "application/x-ndjson", "zstd", 300)
+    assert exc_info.value.status_code == 413
+
+
+def test_ndjson_invalid_line_is_kept_as_error():
+    records = decode_records(b'{"a": 1}\n{bad\n', "application/x-ndjson", None, 1024)
+    assert records[0] == {"a": 1}
+    assert isinstance(records[1], WireFormatError)
@@ -0,0 +1,131 @@
+# wire.py
+
+import json
+import zlib
+from typing import Any, List
+
+try:
+    import zstandard
+except ImportError:  # zstd 압축 요청은 415로 거부
+    zstandard = None
+
+try:
+    import msgpack
+except ImportError:  # msgpack 요청은 415로 거부
+    msgpack = None
+
+# ==============================================================================
+# 일괄 수집(/api/vehicle/realtime/batch) 요청 본문 디코딩
+# ==============================================================================
+# Content-Type:
+#   application/json          레코드 배열 [{...}, {...}] 또는 {"records": [...]}
+#   application/x-ndjson      한 줄에 레코드 하나 (application/jsonl도 허용)
+#   application/msgpack       레코드 배열 (msgpack 설치 시)
+# Content-Encoding:
+#   gzip, zstd (zstandard 설치 시), 없음
+#
+# 압축 해제 후 크기가 max_bytes를 넘으면 거부하여 압축 폭탄으로 메모리가 고갈되지 않도록 합니다.
+
+NDJSON_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl", "application/x-jsonlines")
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+
+
+class WireFormatError(Exception):
+    """요청 본문을 해석할 수 없는 경우. status_code는 응답할 HTTP 상태 코드입니다."""
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _gunzip(body: bytes, max_bytes: int) -> bytes:
+    """여러 gzip 멤버를 이어 붙인 본문(RFC 1952, 예: cat a.gz b.gz)도 모든 멤버를 풀어 이어 붙입니다."""
+    chunks = []
+    size = 0
+    remaining = body
+    while remaining:
+        decompressor = zlib.decompressobj(31)  # wbits=31: gzip 형식, 멤버 하나의 끝에서 멈춤
+        try:
+            chunk = decompressor.decompress(remaining, max_bytes + 1 - size)
+        except zlib.error as e:
+            raise WireFormatError(f"gzip 압축 해제 실패: {e}")
+        chunks.append(chunk)
+        size += len(chunk)
+        if size > max_bytes:
+            break  # 호출하는 쪽에서 413으로 거부
+        if not decompressor.eof:
+            raise WireFormatError("gzip 데이터가 잘렸습니다.")
+        remaining = decompressor.unused_data
+        if not remaining.lstrip(b"\x00"):
+            break  # 멤버 뒤의 0 패딩은 무시 (gzip 모듈과 같은 동작)
+    return b"".join(chunks)
+
+
+def decompress(body: bytes, content_encoding: str, max_bytes: int) -> bytes:
+    encoding = (content_encoding or "identity").strip().lower()
+    if encoding in ("", "identity"):
+        data = body
+    elif encoding in ("gzip", "x-gzip"):
+        data = _gunzip(body, max_bytes)
+    elif encoding == "zstd":
+        if zstandard is None:
+            raise WireFormatError("zstd 압축을 지원하지 않습니다 (zstandard 미설치).", 415)
+        # 여러 프레임을 이어 붙인 본문도 끝까지 풀고, read()가 요청보다 적게 반환할 수 있으므로 빈 값이 나올 때까지 읽습니다.
+        chunks = []
+        size = 0
+        try:
+            with zstandard.ZstdDecompressor().stream_reader(body, read_across_frames=True) as reader:
+                while size <= max_bytes:
+                    chunk = reader.read(max_bytes + 1 - size)
+                    if not chunk:
+                        break
+                    chunks.append(chunk)
+                    size += len(chunk)
+        except zstandard.ZstdError as e:
+            raise WireFormatError(f"zstd 압축 해제 실패: {e}")
+        data = b"".join(chunks)
+    else:
+        raise WireFormatError(f"지원하지 않는 Content-Encoding: {content_encoding}", 415)
+
+    if len(data) > max_bytes:
+        raise WireFormatError(f"압축 해제 후 본문이 {max_bytes}B를 넘습니다.", 413)
+    return data
+
+
+def decode_records(body: bytes, content_type: str, content_encoding: str, max_bytes: int) -> List[Any]:
+    """요청 본문을 레코드(dict) 목록으로 변환합니다. 레코드별 검증은 호출하는 쪽에서 수행합니다."""
+    media_type = (content_type or "application/json").split(";")[0].strip().lower()
+    data = decompress(body, content_encoding, max_bytes)
+
+    if media_type in NDJSON_TYPES:
+        records = []
+        for i, line in enumerate(data.splitlines()):
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError as e:
+                # 줄 단위 오류는 해당 레코드만 실패로 처리하도록 예외 객체를 그대로 넘깁니다.
+                records.append(WireFormatError(f"{i + 1}번째 줄 JSON 파싱 오류: {e}"))
+        return records
+
+    if media_type in MSGPACK_TYPES:
+        if msgpack is None:
+            raise WireFormatError("msgpack 형식을 지원하지 않습니다 (msgpack 미설치).", 415)
+        try:
+            records = msgpack.unpackb(data, raw=False, strict_map_key=False)
+        except Exception as e:
+            raise WireFormatError(f"msgpack 파싱 오류: {e}")
+    elif media_type == "application/json":
+        try:
+            records = json.loads(data)
+        except ValueError as e:
+            raise WireFormatError(f"JSON 파싱 오류: {e}")
+    else:
+        raise WireFormatError(f"지원하지 않는 Content-Type: {content_type}", 415)
+
+    if isinstance(records, dict) and isinstance(records.get("records"), list):
+        records = records["records"]
+    if not isinstance(records, list):
+        raise WireFormatError("본문은 레코드 배열이어야 합니다.")
+    return records
+
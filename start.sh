@@ -15,6 +15,8 @@ P_FILE="./agent/yolov9-s.pt"
 if [ ! -e $P_FILE ]; then
     wget https://github.com/WongKinYiu/yolov9/releases/download/v0.1/yolov9-s.pt -P ./agent/
 fi
+# the metrics module is shared with tango and kept only in tango/metrics.py
+cp ./tango/metrics.py ./agent/metrics.py
 
 docker compose build --no-cache
 if [ $? -ne 0 ]; then
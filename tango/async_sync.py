@@ -0,0 +1,187 @@
+import asyncio
+import os
+import random
+
+from time import time
+
+from aiobotocore.config import AioConfig
+from aiobotocore.session import get_session
+from botocore.exceptions import ClientError
+
+from download_pool import BYTES, DOWNLOAD_SECONDS, FAILURES, OBJECTS, RETRIES
+from run_sync import LIST_REQUESTS, LIST_SECONDS, LISTED_KEYS, LOGGER, S3DirSync
+from verified_download import IntegrityError, prepare_part, verify
+
+
+class AsyncS3DirSync(S3DirSync):
+    # S3DirSync on a single asyncio event loop: up to max_concurrency GETs are in flight at once and
+    # the object bodies are streamed to disk, so syncing many small objects is not bound by per-request latency
+    def __init__(self, bucket:[str], access_key:[str], secret_key:[str], endpoint_url:[str]=None,
+                 max_concurrency:[int]=1000, max_retry:[int]=5, chunk_size:[int]=1024 * 1024,
+                 metrics_port:[int]=None, log_level:[str]='INFO'):
+        self._init_state(bucket, access_key, secret_key, metrics_port, log_level)
+        self.endpoint_url = endpoint_url
+        self.max_concurrency = max_concurrency
+        self.max_retry = max_retry
+        self.chunk_size = chunk_size
+        self.session = get_session()
+
+    def start(self, s3_dir:[str], local_dir:[str], check_period:[int]=300,
+              callback_func=None, callback_threshold:[int]=None, ignore_update_by_init=True,
+              full_list_every:[int]=12, monotonic_keys=False, coalesce_callback=False,
+              layout:[str]='flat', shard_depth:[int]=0,
+              include:[str]=None, exclude:[str]=None, min_size:[int]=None, max_size:[int]=None, since=None,
+              max_local_bytes:[int]=None):
+        asyncio.run(self.start_async(s3_dir, local_dir, check_period, callback_func, callback_threshold,
+                                     ignore_update_by_init, full_list_every, monotonic_keys, coalesce_callback,
+                                     layout, shard_depth, include, exclude, min_size, max_size, since, max_local_bytes))
+
+    async def start_async(self, s3_dir, local_dir, check_period=300, callback_func=None, callback_threshold=None,
+                          ignore_update_by_init=True, full_list_every=12, monotonic_keys=False, coalesce_callback=False,
+                          layout='flat', shard_depth=0, include=None, exclude=None, min_size=None, max_size=None,
+                          since=None, max_local_bytes=None):
+        self._open(s3_dir, local_dir, callback_func, coalesce_callback, layout, shard_depth,
+                   include, exclude, min_size, max_size, since, max_local_bytes)
+
+        config = AioConfig(max_pool_connections=self.max_concurrency,
+                           retries={'max_attempts': self.max_retry, 'mode': 'adaptive'})
+        async with self.session.create_client('s3', endpoint_url=self.endpoint_url, config=config,
+                                              aws_access_key_id=self.access_key,
+                                              aws_secret_access_key=self.secret_key) as client:
+            self.client = client
+            update_tasks = set()
+            num_poll = 0
+            while True:
+                # check whether s3_dir is udpated
+                start_after = self._start_after(num_poll, full_list_every, monotonic_keys)
+                full_list = start_after is None
+                list_start = time()
+                update_list, last_key = await self._list_updates(start_after)
+                LIST_SECONDS.observe(time() - list_start, mode='full' if full_list else 'resume')
+                num_poll += 1
+
+                # download updated data
+                if len(update_list) > 0:
+                    task = asyncio.create_task(self._update(update_list, callback_threshold, ignore_update_by_init,
+                                                            last_key))
+                    update_tasks.add(task)
+                    task.add_done_callback(update_tasks.discard)
+                else:
+                    self._save_state(last_key)
+                ignore_update_by_init = False
+
+                # wait for the next period
+                await asyncio.sleep(check_period)
+
+    async def _list_updates(self, start_after=None):
+        paginator = self.client.get_paginator('list_objects_v2')
+        kwargs = {'Bucket': self.bucket, 'Prefix': self.s3_dir}
+        if start_after:
+            kwargs['StartAfter'] = start_after
+        update_list = []
+        last_key = self.last_key
+        async for page in paginator.paginate(**kwargs):
+            LIST_REQUESTS.inc()
+            LISTED_KEYS.inc(len(page.get('Contents', [])))
+            for content in page.get('Contents', []):
+                key, etag, size = content['Key'], content['ETag'].strip('"'), content['Size']
+                if last_key is None or key > last_key:
+                    last_key = key
+                mtime = content['LastModified'].timestamp()
+                if not self._accept(key, size, mtime):
+                    continue
+                if key in self.pending or not self.index.is_changed(key, etag, size):
+                    continue
+                update_list.append((key, etag, size, mtime))
+                with self.state_lock:
+                    self.pending.add(key)
+        self.index.commit()
+        return update_list + self._requeue_failed(start_after), last_key
+
+    async def _update(self, update_list, callback_threshold, ignore_update=False, last_key=None):
+        # decision for whether to run callback or not; the callback order is reserved here
+        ticket = None
+        if not ignore_update: self.num_update += len(update_list)
+        if self.callback_executor != None and callback_threshold != None:
+            if self.num_update >= callback_threshold:
+                self.num_update = 0
+                ticket = self.callback_executor.reserve()
+
+        # download start: a bounded number of workers keeps memory flat for very large updates
+        LOGGER.info('%d objects are updated', len(update_list))
+        try:
+            queue = asyncio.Queue()
+            for obj in update_list:
+                queue.put_nowait(obj)
+            workers = [asyncio.create_task(self._work(queue))
+                       for _ in range(min(self.max_concurrency, len(update_list)))]
+            await asyncio.gather(*workers)
+            self.index.commit()
+            self._save_state(last_key)
+        finally:
+            # the callback turn and the pending keys are always released (see S3DirSync._update)
+            self._release(update_list, ticket)
+        await asyncio.to_thread(self._evict)
+
+    async def _work(self, queue):
+        while not queue.empty():
+            obj = queue.get_nowait()
+            try:
+                ok = await self._download(obj[0], obj[1], obj[2])
+            except Exception as e:  # e.g. the local directory cannot be created on a full disk
+                LOGGER.warning('%s failed to be downloaded: %s', obj[0], e)
+                ok = False
+            self._record(obj, ok)
+
+    async def _download(self, key, etag, size):
+        local_path = self._local_path(key)
+        part_path = local_path + '.part'
+        prepare_part(part_path, etag)
+        for attempt in range(self.max_retry + 1):
+            start = time()
+            try:
+                # stream the body to disk, resuming after the bytes a failed attempt left in the .part file;
+                # the final name only appears once the object is complete and verified
+                offset = os.path.getsize(part_path) if os.path.isfile(part_path) else 0
+                kwargs = {'Bucket': self.bucket, 'Key': key}
+                if etag:
+                    kwargs['IfMatch'] = f'"{etag}"'
+                if 0 < offset < size:
+                    kwargs['Range'] = f'bytes={offset}-'
+                else:
+                    offset = 0
+                response = await self.client.get_object(**kwargs)
+                async with response['Body'] as stream:
+                    with open(part_path, 'ab' if offset > 0 else 'wb') as f:
+                        while True:
+                            chunk = await stream.read(self.chunk_size)
+                            if not chunk:
+                                break
+                            f.write(chunk)
+                await asyncio.to_thread(verify, part_path, etag, size)
+                os.replace(part_path, local_path)
+                os.remove(part_path + '.etag')
+                DOWNLOAD_SECONDS.observe(time() - start, kind='stream')
+                OBJECTS.inc()
+                BYTES.inc(size)
+                return True
+            except ClientError as e:
+                code = e.response.get('Error', {}).get('Code')
+                if code in ('412', 'PreconditionFailed') and os.path.isfile(part_path):
+                    os.remove(part_path)
+                if code in ('403', '404', '412', 'NoSuchKey', 'AccessDenied', 'PreconditionFailed'):
+                    LOGGER.warning('%s failed to be downloaded: %s', key, e)
+                    FAILURES.inc()
+                    return False
+                error = e
+            except IntegrityError as e:
+                os.remove(part_path)
+                error = e
+            except Exception as e:
+                error = e
+            if attempt < self.max_retry:
+                RETRIES.inc()
+                await asyncio.sleep(min(0.5 * 2 ** attempt, 60) * random.uniform(0.5, 1.0))
+        LOGGER.warning('%s failed to be downloaded after %d attempts: %s', key, self.max_retry + 1, error)
+        FAILURES.inc()
+        return False
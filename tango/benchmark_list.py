@@ -0,0 +1,67 @@
+import argparse
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from time import time
+
+from run_sync import S3DirSync
+
+
+def populate(sync, bucket, s3_dir, num_key, num_dir):
+    # num_key empty objects spread over num_dir agent-style run directories
+    try:
+        sync.client.create_bucket(Bucket=bucket)
+    except sync.client.exceptions.BucketAlreadyOwnedByYou:
+        pass
+    keys = [f'{s3_dir}{idx % num_dir:012d}/{idx:09d}.jpg' for idx in range(num_key)]
+    with ThreadPoolExecutor(64) as pool:
+        list(pool.map(lambda key: sync.client.put_object(Bucket=bucket, Key=key, Body=b''), keys))
+
+
+def count_listed(sync, start_after):
+    start = time()
+    num_key = sum(1 for _ in sync._list_objects(start_after))
+    return num_key, time() - start
+
+
+def main(opt):
+    # run against a local S3 stand-in, e.g. MinIO or `moto_server -p 5000` with --endpoint-url http://127.0.0.1:5000
+    sync = S3DirSync(opt.bucket, opt.access_key, opt.secret_key, endpoint_url=opt.endpoint_url)
+    sync.s3_dir, sync.local_dir = sync._dir_format(opt.s3_dir, tempfile.mkdtemp())
+    if opt.populate:
+        start = time()
+        populate(sync, opt.bucket, sync.s3_dir, opt.num_key, opt.num_dir)
+        print(f'populated {opt.num_key} keys in {time() - start:.1f}s')
+
+    num_key, full_t = count_listed(sync, None)
+    last_dir = f'{sync.s3_dir}{opt.num_dir - 1:012d}/'
+    last_key = max(content['Key'] for content in sync._list_objects(last_dir))  # high-water mark of the listing
+
+    # a new run directory with opt.num_new keys arrives after the high-water mark
+    new_dir = f'{sync.s3_dir}{opt.num_dir:012d}/'
+    for idx in range(opt.num_new):
+        sync.client.put_object(Bucket=opt.bucket, Key=f'{new_dir}{idx:09d}.jpg', Body=b'')
+    num_inc, inc_t = count_listed(sync, sync._resume_key(last_key))
+    num_mono, mono_t = count_listed(sync, sync._resume_key(last_key, monotonic_keys=True))
+
+    print(f'full listing:        {num_key} keys in {full_t:.2f}s')
+    print(f'incremental listing: {num_inc} keys in {inc_t:.3f}s (restart at the latest directory)')
+    print(f'incremental listing: {num_mono} keys in {mono_t:.3f}s (monotonic keys)')
+
+
+def parse_opt():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--bucket', type=str, default='benchmark')
+    parser.add_argument('--s3-dir', type=str, default='list-benchmark')
+    parser.add_argument('--endpoint-url', type=str, default=os.environ.get('S3_ENDPOINT_URL') or None)
+    parser.add_argument('--access-key', type=str, default=os.environ.get('AWS_ACCESS_KEY_ID', 'testing'))
+    parser.add_argument('--secret-key', type=str, default=os.environ.get('AWS_SECRET_ACCESS_KEY', 'testing'))
+    parser.add_argument('--populate', action='store_true', help='create the keys before listing')
+    parser.add_argument('--num-key', type=int, default=1000000)
+    parser.add_argument('--num-dir', type=int, default=1000)
+    parser.add_argument('--num-new', type=int, default=100)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main(parse_opt())
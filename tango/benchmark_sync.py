@@ -0,0 +1,68 @@
+import argparse
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import sleep, time
+
+from async_sync import AsyncS3DirSync
+from run_sync import S3DirSync
+
+
+def populate(client, bucket, s3_dir, num_obj, size):
+    try:
+        client.create_bucket(Bucket=bucket)
+    except client.exceptions.BucketAlreadyOwnedByYou:
+        pass
+    body = os.urandom(size)
+    with ThreadPoolExecutor(64) as pool:
+        list(pool.map(lambda idx: client.put_object(Bucket=bucket, Key=f'{s3_dir}/{idx:09d}.jpg', Body=body),
+                      range(num_obj)))
+
+
+def time_sync(sync, s3_dir, num_obj):
+    # seconds until num_obj objects are synced into an empty local directory by one poll
+    local_dir = tempfile.mkdtemp()
+    start = time()
+    threading.Thread(target=sync.start, args=(s3_dir, local_dir), kwargs={'check_period': 3600}, daemon=True).start()
+    while getattr(sync, 'index', None) is None or len(sync.index) < num_obj:
+        sleep(0.1)
+    elapsed = time() - start
+    shutil.rmtree(local_dir, ignore_errors=True)
+    return elapsed
+
+
+def main(opt):
+    # run against a local S3 stand-in, e.g. MinIO or `moto_server -p 5000` with --endpoint-url http://127.0.0.1:5000
+    keys = (opt.bucket, opt.access_key, opt.secret_key)
+    threaded = S3DirSync(*keys, endpoint_url=opt.endpoint_url, num_worker=opt.num_worker)
+    if opt.populate:
+        populate(threaded.client, opt.bucket, opt.s3_dir, opt.num_obj, opt.size)
+
+    results = [('S3DirSync', opt.num_worker, time_sync(threaded, opt.s3_dir, opt.num_obj))]
+    asynchronous = AsyncS3DirSync(*keys, endpoint_url=opt.endpoint_url, max_concurrency=opt.max_concurrency)
+    results.append(('AsyncS3DirSync', opt.max_concurrency, time_sync(asynchronous, opt.s3_dir, opt.num_obj)))
+
+    for name, concurrency, elapsed in results:
+        print(f'{name:>15} (concurrency {concurrency:>5}): {opt.num_obj} objects in {elapsed:.1f}s, '
+              f'{opt.num_obj / elapsed:.0f} obj/s')
+
+
+def parse_opt():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--bucket', type=str, default='benchmark')
+    parser.add_argument('--s3-dir', type=str, default='sync-benchmark')
+    parser.add_argument('--endpoint-url', type=str, default=os.environ.get('S3_ENDPOINT_URL') or None)
+    parser.add_argument('--access-key', type=str, default=os.environ.get('AWS_ACCESS_KEY_ID', 'testing'))
+    parser.add_argument('--secret-key', type=str, default=os.environ.get('AWS_SECRET_ACCESS_KEY', 'testing'))
+    parser.add_argument('--populate', action='store_true', help='create the objects before syncing')
+    parser.add_argument('--num-obj', type=int, default=100000)
+    parser.add_argument('--size', type=int, default=20 * 1024, help='object size in bytes')
+    parser.add_argument('--num-worker', type=int, default=8, help='threads of S3DirSync')
+    parser.add_argument('--max-concurrency', type=int, default=1000, help='in-flight GETs of AsyncS3DirSync')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main(parse_opt())
@@ -0,0 +1,69 @@
+import logging
+import threading
+
+from collections import deque
+from time import time
+
+from metrics import REGISTRY
+
+
+LOGGER = logging.getLogger('tango')
+CALLBACK_SECONDS = REGISTRY.histogram('tango_callback_seconds', 'Duration of the callback runs')
+CALLBACK_FAILURES = REGISTRY.counter('tango_callback_failures_total', 'Callback runs which raised')
+
+
+class CallbackTicket:
+    # one callback trigger; ready when its downloads are done, done when its callback has run
+    def __init__(self):
+        self.ready = False
+        self.done = threading.Event()
+
+    def wait(self, timeout=None):
+        return self.done.wait(timeout)
+
+
+class CallbackExecutor:
+    # runs the callback on a single dispatcher thread, in the order the triggers were reserved.
+    # With coalesce, consecutive triggers that are ready by the time the dispatcher gets to them
+    # are merged into one callback run. on_run(started) is called after every successful run.
+    def __init__(self, callback_func, coalesce=False, on_run=None):
+        self.callback_func = callback_func
+        self.coalesce = coalesce
+        self.on_run = on_run
+        self.cond = threading.Condition()
+        self.tickets = deque()
+        self.num_run = 0
+        self.trd = threading.Thread(target=self._dispatch, daemon=True, name='callback')
+        self.trd.start()
+
+    def reserve(self):
+        # called when the update threshold is hit, before the downloads of the update are done
+        ticket = CallbackTicket()
+        with self.cond:
+            self.tickets.append(ticket)
+        return ticket
+
+    def ready(self, ticket):
+        with self.cond:
+            ticket.ready = True
+            self.cond.notify_all()
+
+    def _dispatch(self):
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.tickets and self.tickets[0].ready)
+                batch = [self.tickets.popleft()]
+                while self.coalesce and self.tickets and self.tickets[0].ready:
+                    batch.append(self.tickets.popleft())
+            started = time()
+            try:
+                self.callback_func()
+                CALLBACK_SECONDS.observe(time() - started)
+                if self.on_run != None:
+                    self.on_run(started)
+            except Exception as e:  # a failing callback must not stop the following ones
+                LOGGER.error('callback failed: %s', e)
+                CALLBACK_FAILURES.inc()
+            self.num_run += 1
+            for ticket in batch:
+                ticket.done.set()
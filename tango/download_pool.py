@@ -0,0 +1,157 @@
+import logging
+import random
+import threading
+
+from itertools import count
+from queue import PriorityQueue
+from time import sleep, time
+
+from botocore.exceptions import ClientError
+
+from metrics import REGISTRY
+from verified_download import download_verified
+
+
+MB = 1024 * 1024
+LOGGER = logging.getLogger('tango')
+OBJECTS = REGISTRY.counter('tango_objects_downloaded_total', 'Objects downloaded from S3')
+BYTES = REGISTRY.counter('tango_bytes_downloaded_total', 'Bytes downloaded from S3')
+FAILURES = REGISTRY.counter('tango_download_failures_total', 'Objects given up after their retries')
+RETRIES = REGISTRY.counter('tango_download_retries_total', 'Download attempts retried')
+DOWNLOAD_SECONDS = REGISTRY.histogram('tango_download_seconds', 'Download latency per object', ['kind'])
+QUEUE_DEPTH = REGISTRY.gauge('tango_download_queue_depth', 'Objects waiting for a download thread')
+
+
+class DownloadBatch:
+    # completion tracking of the objects submitted by one update
+    def __init__(self, num_obj):
+        self.lock = threading.Lock()
+        self.remaining = num_obj
+        self.failed_list = []
+        self.event = threading.Event()
+        if num_obj == 0:
+            self.event.set()
+
+    def done(self, key, ok):
+        with self.lock:
+            if not ok:
+                self.failed_list.append(key)
+            self.remaining -= 1
+            if self.remaining == 0:
+                self.event.set()
+
+    def wait(self, timeout=None):
+        return self.event.wait(timeout)
+
+
+class BandwidthLimiter:
+    # token bucket shared by every transfer, used as the boto3 progress callback
+    def __init__(self, max_bandwidth):
+        self.max_bandwidth = max_bandwidth
+        self.lock = threading.Lock()
+        self.allowance = 0.0
+        self.last_time = time()
+
+    def __call__(self, num_byte):
+        if not self.max_bandwidth:
+            return
+        with self.lock:
+            now = time()
+            self.allowance = min(self.allowance + (now - self.last_time) * self.max_bandwidth, self.max_bandwidth)
+            self.last_time = now
+            self.allowance -= num_byte
+            delay = -self.allowance / self.max_bandwidth if self.allowance < 0 else 0
+        if delay > 0:
+            sleep(delay)
+
+
+class DownloadPool:
+    # persistent pool of download threads fed by a work queue of single objects.
+    # Small objects are scheduled first; objects above multipart_threshold are fetched with concurrent ranged GETs
+    # and occupy multipart_concurrency of the max_concurrency connection slots.
+    # Every object is written to a .part file, verified against its size and ETag and renamed into place.
+    def __init__(self, client, bucket, num_worker=8, max_concurrency=None, max_bandwidth=None, max_retry=5,
+                 backoff=0.5, multipart_threshold=64 * MB, multipart_chunksize=16 * MB, multipart_concurrency=4):
+        self.client = client
+        self.bucket = bucket
+        self.max_concurrency = max_concurrency or num_worker
+        self.max_retry = max_retry
+        self.backoff = backoff
+        self.multipart_threshold = multipart_threshold
+        self.multipart_chunksize = multipart_chunksize
+        self.multipart_concurrency = min(multipart_concurrency, self.max_concurrency)
+        self.limiter = BandwidthLimiter(max_bandwidth)
+        self.slot_cond = threading.Condition()
+        self.free_slot = self.max_concurrency
+        self.queue = PriorityQueue()
+        self.seq = count()
+        QUEUE_DEPTH.set_function(self.queue.qsize)
+
+        self.trd_list = [threading.Thread(target=self._work, daemon=True, name=f's3_download_#{idx}')
+                         for idx in range(num_worker)]
+        for trd in self.trd_list:
+            trd.start()
+
+    def submit(self, key, local_path, etag, size, on_done):
+        # on_done(ok) is called from a pool thread when the object is downloaded or given up
+        priority = 0 if size < self.multipart_threshold else 1
+        self.queue.put((priority, next(self.seq), (key, local_path, etag, size, on_done)))
+
+    def close(self):
+        for _ in self.trd_list:
+            self.queue.put((2, next(self.seq), None))
+        for trd in self.trd_list:
+            trd.join()
+
+    def _work(self):
+        while True:
+            _, _, task = self.queue.get()
+            if task is None:
+                return
+            key, local_path, etag, size, on_done = task
+            on_done(self._download(key, local_path, etag, size))
+
+    def _download(self, key, local_path, etag, size):
+        num_slot = self.multipart_concurrency if size >= self.multipart_threshold else 1
+        kind = 'ranged' if size >= self.multipart_threshold else 'single'
+        for attempt in range(self.max_retry + 1):
+            self._acquire(num_slot)
+            start = time()
+            try:
+                # a retry resumes from the .part file left by the failed attempt
+                download_verified(self.client, self.bucket, key, local_path, etag, size,
+                                  multipart_threshold=self.multipart_threshold, chunk_size=self.multipart_chunksize,
+                                  concurrency=self.multipart_concurrency, callback=self.limiter)
+                DOWNLOAD_SECONDS.observe(time() - start, kind=kind)
+                OBJECTS.inc()
+                BYTES.inc(size)
+                return True
+            except ClientError as e:
+                # 412: the object changed since it was listed, the next poll lists it again with its new ETag
+                if e.response.get('Error', {}).get('Code') in ('403', '404', '412', 'NoSuchKey', 'AccessDenied',
+                                                               'PreconditionFailed'):
+                    LOGGER.warning('%s failed to be downloaded: %s', key, e)
+                    FAILURES.inc()
+                    return False
+                error = e
+            except Exception as e:
+                error = e
+            finally:
+                self._release(num_slot)
+            # exponential backoff with jitter
+            if attempt < self.max_retry:
+                RETRIES.inc()
+                sleep(min(self.backoff * 2 ** attempt, 60) * random.uniform(0.5, 1.0))
+        LOGGER.warning('%s failed to be downloaded after %d attempts: %s', key, self.max_retry + 1, error)
+        FAILURES.inc()
+        return False
+
+    def _acquire(self, num_slot):
+        with self.slot_cond:
+            self.slot_cond.wait_for(lambda: self.free_slot >= num_slot)
+            self.free_slot -= num_slot
+
+    def _release(self, num_slot):
+        with self.slot_cond:
+            self.free_slot += num_slot
+            self.slot_cond.notify_all()
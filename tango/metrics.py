@@ -0,0 +1,248 @@
+import json
+import logging
+import os
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import time
+
+
+# latency buckets in seconds, from a small PUT/GET on a local network to a large multipart transfer
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# sync lag buckets in seconds, from an event-driven sync to a periodic one
+LAG_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+
+class Metric:
+    # one metric family; values are kept per tuple of label values
+    def __init__(self, name, help, kind, labelnames=()):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def _labels(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def _format_labels(self, values, extra=None):
+        pairs = list(zip(self.labelnames, values)) + ([extra] if extra else [])
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{value}"' for name, value in pairs) + '}'
+
+    def _snapshot_key(self, values):
+        return ','.join(f'{name}={value}' for name, value in zip(self.labelnames, values)) or 'value'
+
+
+class Counter(Metric):
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, 'counter', labelnames)
+
+    def inc(self, amount=1, **labels):
+        key = self._labels(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        with self.lock:
+            return [f'{self.name}{self._format_labels(key)} {value}' for key, value in self.values.items()]
+
+    def snapshot(self):
+        with self.lock:
+            return {self._snapshot_key(key): value for key, value in self.values.items()}
+
+
+class Gauge(Metric):
+    # set explicitly, or read from a function at collection time (e.g. a queue depth)
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, 'gauge', labelnames)
+        self.functions = {}
+
+    def set(self, value, **labels):
+        key = self._labels(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def set_function(self, function, **labels):
+        key = self._labels(labels)
+        with self.lock:
+            self.functions[key] = function
+
+    def _collect(self):
+        with self.lock:
+            values = dict(self.values)
+            functions = dict(self.functions)
+        for key, function in functions.items():
+            try:
+                values[key] = function()
+            except Exception:  # e.g. the object behind the function is already closed
+                continue
+        return values
+
+    def render(self):
+        return [f'{self.name}{self._format_labels(key)} {value}' for key, value in self._collect().items()]
+
+    def snapshot(self):
+        return {self._snapshot_key(key): value for key, value in self._collect().items()}
+
+
+class Histogram(Metric):
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, 'histogram', labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._labels(labels)
+        with self.lock:
+            counts = self.values.get(key)
+            if counts is None:
+                counts = self.values[key] = [[0] * len(self.buckets), 0, 0.0]  # bucket counts, count, sum
+            for idx, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[0][idx] += 1
+            counts[1] += 1
+            counts[2] += value
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for key, (bucket_counts, count, total) in self.values.items():
+                for bound, bucket_count in zip(self.buckets, bucket_counts):
+                    lines.append(f'{self.name}_bucket{self._format_labels(key, ("le", bound))} {bucket_count}')
+                lines.append(f'{self.name}_bucket{self._format_labels(key, ("le", "+Inf"))} {count}')
+                lines.append(f'{self.name}_count{self._format_labels(key)} {count}')
+                lines.append(f'{self.name}_sum{self._format_labels(key)} {total}')
+        return lines
+
+    def snapshot(self):
+        snapshot = {}
+        with self.lock:
+            for key, (bucket_counts, count, total) in self.values.items():
+                snapshot[self._snapshot_key(key)] = {'count': count, 'sum': total,
+                                                     'p50': self._quantile(bucket_counts, count, 0.5),
+                                                     'p99': self._quantile(bucket_counts, count, 0.99)}
+        return snapshot
+
+    def _quantile(self, bucket_counts, count, q):
+        # upper bound of the bucket holding the q-quantile, None above the last bucket
+        for bound, bucket_count in zip(self.buckets, bucket_counts):
+            if count > 0 and bucket_count >= q * count:
+                return bound
+        return None
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+
+    def counter(self, name, help, labelnames=()):
+        return self._register(Counter, name, help, labelnames)
+
+    def gauge(self, name, help, labelnames=()):
+        return self._register(Gauge, name, help, labelnames)
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram, name, help, labelnames, buckets=buckets)
+
+    def _register(self, cls, name, help, labelnames, **kwargs):
+        # registering the same name again returns the existing metric, e.g. for a second S3DirSync
+        with self.lock:
+            if name not in self.metrics:
+                self.metrics[name] = cls(name, help, labelnames, **kwargs)
+            return self.metrics[name]
+
+    def render(self):
+        # Prometheus text exposition format
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        return {'time': time(), 'metrics': {metric.name: metric.snapshot() for metric in list(self.metrics.values())}}
+
+
+REGISTRY = Registry()
+
+
+def serve_metrics(port, host='0.0.0.0', registry=REGISTRY):
+    # GET /metrics for Prometheus, GET /metrics.json for a JSON snapshot
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.startswith('/metrics.json'):
+                body, content_type = json.dumps(registry.snapshot()).encode(), 'application/json'
+            elif self.path.startswith('/metrics'):
+                body, content_type = registry.render().encode(), 'text/plain; version=0.0.4'
+            else:
+                self.send_response(404)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True, name='metrics').start()
+    return server
+
+
+def dump_metrics(path, period, stop_event=None, registry=REGISTRY):
+    # write a JSON snapshot to path every period seconds, e.g. for a node without a Prometheus scraper
+    stop_event = stop_event or threading.Event()
+
+    def dump():
+        while not stop_event.wait(period):
+            with open(path + '.tmp', 'w') as f:
+                json.dump(registry.snapshot(), f)
+            os.replace(path + '.tmp', path)
+
+    threading.Thread(target=dump, daemon=True, name='metrics_dump').start()
+    return stop_event
+
+
+class RateLimitFilter(logging.Filter):
+    # let at most rate records of the same message template through per period seconds;
+    # the number of suppressed records is reported with the next record that passes
+    def __init__(self, rate=10, period=60.0):
+        super().__init__()
+        self.rate = rate
+        self.period = period
+        self.lock = threading.Lock()
+        self.windows = {}
+
+    def filter(self, record):
+        key = (record.name, record.levelno, record.msg)
+        now = time()
+        with self.lock:
+            start, num_passed, num_suppressed = self.windows.get(key, (now, 0, 0))
+            if now - start >= self.period:
+                start, num_passed = now, 0
+            if num_passed >= self.rate:
+                self.windows[key] = (start, num_passed, num_suppressed + 1)
+                return False
+            self.windows[key] = (start, num_passed + 1, 0)
+        if num_suppressed > 0:
+            record.msg = f'{record.msg} ({num_suppressed} similar messages suppressed)'
+        return True
+
+
+def setup_logging(name, level='INFO', rate=10, period=60.0):
+    # leveled logger with a rate-limited stream handler, unless the application configured its own handlers
+    logger = logging.getLogger(name)
+    logger.setLevel(level)
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+        handler.addFilter(RateLimitFilter(rate, period))
+        logger.addHandler(handler)
+    return logger
@@ -1,103 +1,425 @@
 import boto3
+import hashlib
+import logging
 import os
 import threading
 
-from time import sleep
-from datetime import datetime
+from time import sleep, time
+
+from botocore.config import Config
+
+from callback_executor import CallbackExecutor
+from download_pool import DownloadBatch, DownloadPool
+from metrics import LAG_BUCKETS, REGISTRY, serve_metrics, setup_logging
+from sync_filter import SyncFilter
+from sync_index import SyncIndex
+
+
+LOGGER = logging.getLogger('tango')
+LIST_SECONDS = REGISTRY.histogram('tango_list_seconds', 'Duration of a listing of s3_dir', ['mode'])
+LIST_REQUESTS = REGISTRY.counter('tango_list_requests_total', 'ListObjectsV2 requests')
+LISTED_KEYS = REGISTRY.counter('tango_listed_keys_total', 'Keys returned by ListObjectsV2')
+SYNC_LAG = REGISTRY.histogram('tango_sync_lag_seconds', 'Time from S3 LastModified to local availability',
+                              buckets=LAG_BUCKETS)
+PENDING = REGISTRY.gauge('tango_pending_objects', 'Objects listed for download but not downloaded yet')
+LOCAL_BYTES = REGISTRY.gauge('tango_local_bytes', 'Bytes of synced files kept in local_dir')
+EVICTED = REGISTRY.counter('tango_evicted_files_total', 'Files evicted to stay within max_local_bytes')
 
 
 class S3DirSync:
-    def __init__(self, bucket:[str], access_key:[str], secret_key:[str]):
+    INDEX_FILE = '.s3dirsync.db'
+    LAYOUTS = ('flat', 'prefix')
+
+    def __init__(self, bucket:[str], access_key:[str], secret_key:[str], endpoint_url:[str]=None,
+                 num_worker:[int]=8, max_concurrency:[int]=None, max_bandwidth:[int]=None, max_retry:[int]=5,
+                 metrics_port:[int]=None, log_level:[str]='INFO'):
+        self._init_state(bucket, access_key, secret_key, metrics_port, log_level)
+
+        # aws session open
+        aws_session = boto3.Session(aws_access_key_id=self.access_key,
+                                    aws_secret_access_key=self.secret_key)
+        max_concurrency = max_concurrency or num_worker
+        self.client = aws_session.client('s3', endpoint_url=endpoint_url,
+                                         config=Config(max_pool_connections=max_concurrency))
+
+        # persistent download threads shared by every update
+        self.pool = DownloadPool(self.client, self.bucket, num_worker=num_worker, max_concurrency=max_concurrency,
+                                 max_bandwidth=max_bandwidth, max_retry=max_retry)
+
+    def _init_state(self, bucket, access_key, secret_key, metrics_port, log_level):
+        # sync state shared with AsyncS3DirSync, which only replaces the S3 client and the downloads
         self.bucket = bucket
         self.access_key = access_key
         self.secret_key = secret_key
         self.num_update = 0
-        self.callback_in_progress = []
+        self.callback_executor = None
+        self.last_key = None  # high-water mark of the listing, saved in the index
+        self.listed_key = None  # greatest key listed so far; the mark reaches it once nothing below is left
+        self.state_lock = threading.Lock()
+        self.pending = set()  # keys listed for download but not downloaded yet
+        self.failed = {}  # key: (key, etag, size, mtime) of the objects whose download failed
+        self.layout = 'flat'
+        self.shard_depth = 0
+        self.made_dirs = set()
+        self.sync_filter = SyncFilter()
+        self.max_local_bytes = None
+        self.evict_lock = threading.Lock()
 
-        # aws session open
-        aws_session = boto3.Session(aws_access_key_id=self.access_key,
-                                    aws_secret_access_key=self.secret_key)
-        self.client = aws_session.client('s3')
+        # leveled, rate-limited logs and the metrics endpoint (/metrics and /metrics.json)
+        setup_logging('tango', log_level)
+        PENDING.set_function(lambda: len(self.pending))
+        if metrics_port:
+            serve_metrics(metrics_port)
 
     def start(self, s3_dir:[str], local_dir:[str], check_period:[int]=300,
-              callback_func=None, callback_threshold:[int]=None, ignore_update_by_init=True):
-        # directory parameter formatting
-        self.s3_dir, self.local_dir = self._dir_format(s3_dir, local_dir)
+              callback_func=None, callback_threshold:[int]=None, ignore_update_by_init=True,
+              full_list_every:[int]=12, monotonic_keys=False, event_source=None, reconcile_period:[int]=3600,
+              coalesce_callback=False, layout:[str]='flat', shard_depth:[int]=0,
+              include:[str]=None, exclude:[str]=None, min_size:[int]=None, max_size:[int]=None, since=None,
+              max_local_bytes:[int]=None):
+        self._open(s3_dir, local_dir, callback_func, coalesce_callback, layout, shard_depth,
+                   include, exclude, min_size, max_size, since, max_local_bytes)
 
-        # initiate file_list and directory structure of local_dir
-        self.file_list = set()
-        if os.path.isdir(self.local_dir):
-            for obj in os.scandir(self.local_dir):
-                if obj.is_file():
-                    self.file_list.add(obj)
-        else:
-            os.makedirs(self.local_dir)
+        # with bucket notifications, objects are downloaded as they arrive and the listing below
+        # only reconciles missed events every reconcile_period seconds. Missed or lost notifications (SQS messages
+        # are deleted once received) can be for any key, so every reconcile pass is a full listing checked against
+        # the index rather than the incremental listing after the high-water mark
+        if event_source is not None:
+            check_period = reconcile_period
+            full_list_every = 1
+            threading.Thread(target=self._watch_events, args=(event_source, callback_func, callback_threshold),
+                             daemon=True, name='s3_events').start()
 
+        num_poll = 0
         while True:
             # check whether s3_dir is udpated
-            update_list = []
-            for content in self.client.list_objects_v2(Bucket=self.bucket, Prefix=self.s3_dir)['Contents']:
-                obj_name = content['Key'].split('/')[-1]
-                if obj_name in self.file_list:
-                    pass
-                else:
-                    update_list.append(content['Key'])
-                    self.file_list.add(obj_name)
+            start_after = self._start_after(num_poll, full_list_every, monotonic_keys)
+            full_list = start_after is None
+            list_start = time()
+            update_list, last_key = self._list_updates(start_after)
+            LIST_SECONDS.observe(time() - list_start, mode='full' if full_list else 'resume')
+            num_poll += 1
 
             # download updated data
             if len(update_list) > 0:
                 update_trd = threading.Thread(target=self._update,
-                                              args=(update_list, callback_func, callback_threshold, ignore_update_by_init),
+                                              args=(update_list, callback_func, callback_threshold, ignore_update_by_init,
+                                                    last_key),
                                               daemon=True, name='update')
                 update_trd.start()
+            else:
+                self._save_state(last_key)
             ignore_update_by_init = False
 
             # wait for the next period
             sleep(check_period)
 
-    def _update(self, update_list, callback_func, callback_threshold, ignore_update=False):
-        # download with multi threads if the number of data is bigger than 1000.
-        trd_list = []
-        num_trd = min(len(update_list) // 1000, 7) + 1 # maximum number of threads is 8.
-
-        # decision for whether to run callback or not
-        if not ignore_update: self.num_update += len(update_list)
-        run_callback = False
-        if callback_func != None and callback_threshold != None:            # if callback is given
-            if self.num_update >= callback_threshold:                       # if num_update is enough for callback
-                run_callback = True
-                self.num_update = 0
-                callback_name = datetime.today().strftime("%Y%m%d%H%M%S")
-                self.callback_in_progress.append(callback_name)
-
-        # download start
-        term = len(update_list) // num_trd + 1
-        start_idx = 0
-        end_idx = min(term, len(update_list))
-        print(update_list, len(update_list))
-        for idx in range(num_trd):
-            print(start_idx, end_idx)
-            trd_list.append(threading.Thread(target=self._download, args=(update_list[start_idx:end_idx],),
-                                             daemon=True, name=f's3_download_#{idx}'))
-            start_idx = end_idx
-            end_idx = min(end_idx + term, len(update_list))
-        for idx in range(num_trd):
-            trd_list[idx].start()
-        for idx in range(num_trd):
-            trd_list[idx].join()
-
-        # run callback after downloads are done
-        if run_callback:
-            # wait until the previous callback is done
-            while self.callback_in_progress[0]!=callback_name:
-                sleep(600)
-            callback_func()
-            self.callback_in_progress.pop(0)
-
-    def _download(self, update_list):
-        for obj_path in update_list:
-            obj_name = obj_path.split('/')[-1]
-            self.client.download_file(self.bucket, obj_path, self.local_dir + '/' + obj_name)
+    def _open(self, s3_dir, local_dir, callback_func=None, coalesce_callback=False, layout='flat', shard_depth=0,
+              include=None, exclude=None, min_size=None, max_size=None, since=None, max_local_bytes=None):
+        # directory parameter formatting
+        self.s3_dir, self.local_dir = self._dir_format(s3_dir, local_dir)
+
+        # initiate directory structure of local_dir and the index of synced objects
+        if not os.path.isdir(self.local_dir):
+            os.makedirs(self.local_dir)
+        self.index = SyncIndex(self.local_dir + self.INDEX_FILE)
+        self._load_state()
+        self._set_layout(layout, shard_depth)
+        self.sync_filter = SyncFilter(include, exclude, min_size, max_size, since)
+        self.max_local_bytes = max_local_bytes
+        if callback_func != None:
+            self.callback_executor = CallbackExecutor(callback_func, coalesce=coalesce_callback,
+                                                      on_run=self._on_consumed)
+
+    def _watch_events(self, event_source, callback_func, callback_threshold, batch_period=1.0, max_batch=1000,
+                      max_backoff=60):
+        # collect created objects for up to batch_period seconds and download them as one update.
+        # Errors of the event source are retried with a backoff, so event mode does not silently stop
+        backoff = 1
+        while True:
+            update_list = []
+            error = None
+            deadline = time() + batch_period
+            try:
+                while time() < deadline and len(update_list) < max_batch:
+                    for key, etag, size in event_source.events(timeout=max(deadline - time(), 0.01)):
+                        if not key.startswith(self.s3_dir) or key.endswith('/'):
+                            continue
+                        if not self._accept(key, size, time()):
+                            continue
+                        with self.state_lock:
+                            if key in self.pending:
+                                continue
+                        if not self.index.is_changed(key, etag, size):
+                            continue
+                        update_list.append((key, etag, size, time()))
+                        with self.state_lock:
+                            self.pending.add(key)
+            except Exception as e:
+                error = e
+            if len(update_list) > 0:
+                threading.Thread(target=self._update, args=(update_list, callback_func, callback_threshold),
+                                 daemon=True, name='update').start()
+            if error is None:
+                backoff = 1
+            else:
+                LOGGER.warning('Receiving S3 events failed, retrying in %d seconds: %s', backoff, error)
+                sleep(backoff)
+                backoff = min(backoff * 2, max_backoff)
+
+    def _list_updates(self, start_after=None):
+        # new and changed objects after start_after, plus the failed objects to retry, and the greatest listed key
+        update_list = []
+        last_key = self.last_key
+        for content in self._list_objects(start_after):
+            key, etag, size = content['Key'], content['ETag'].strip('"'), content['Size']
+            if last_key is None or key > last_key:
+                last_key = key
+            mtime = content['LastModified'].timestamp()
+            if not self._accept(key, size, mtime):
+                continue
+            if key in self.pending or not self.index.is_changed(key, etag, size):
+                continue
+            obj = (key, etag, size, mtime)
+            local_path = self._local_path(key)
+            if self.index.get(key) is None and os.path.isfile(local_path) and os.path.getsize(local_path) == size:
+                self.index.put(*obj)  # synced before the index existed
+                self.index.add_local(key, local_path, size, time(), consumed=True)
+                continue
+            update_list.append(obj)
+            with self.state_lock:
+                self.pending.add(key)
+        self.index.commit()
+        return update_list + self._requeue_failed(start_after), last_key
+
+    def _list_objects(self, start_after=None):
+        # follow ContinuationToken through every page; an empty prefix has no 'Contents'
+        paginator = self.client.get_paginator('list_objects_v2')
+        kwargs = {'Bucket': self.bucket, 'Prefix': self.s3_dir}
+        if start_after:
+            kwargs['StartAfter'] = start_after
+        for page in paginator.paginate(**kwargs):
+            LIST_REQUESTS.inc()
+            LISTED_KEYS.inc(len(page.get('Contents', [])))
+            for content in page.get('Contents', []):
+                yield content
+
+    def _start_after(self, num_poll, full_list_every, monotonic_keys=False):
+        # only the keys after the high-water mark are listed, plus a full listing (None) at the first poll and every
+        # full_list_every polls. The full listing picks up keys added below the mark, e.g. late uploads into the run
+        # directory of a long-running agent while another run directory was already listed
+        if self.last_key is None or (full_list_every and num_poll % full_list_every == 0):
+            return None
+        return self._resume_key(self.last_key, monotonic_keys)
+
+    def _resume_key(self, last_key, monotonic_keys=False):
+        # keys in the latest sub directory (e.g. an agent run prefix) may still be added in any order,
+        # so listing restarts at that directory unless keys are known to only increase
+        if monotonic_keys:
+            return last_key
+        return last_key[:last_key.rfind('/') + 1]
+
+    def _load_state(self):
+        if self.index.get_meta('source') == f'{self.bucket}/{self.s3_dir}':
+            self.last_key = self.listed_key = self.index.get_meta('last_key')
+            self.failed = {row[0]: tuple(row) for row in self.index.failed()}
+        else:
+            self.index.set_meta('source', f'{self.bucket}/{self.s3_dir}')
+
+    def _set_layout(self, layout, shard_depth):
+        # the layout is recorded in the index, since the synced files of another layout would not be found again
+        if layout not in self.LAYOUTS:
+            raise ValueError(f'layout must be one of {self.LAYOUTS}: {layout}')
+        saved = self.index.get_meta('layout') or ('flat/0' if len(self.index) > 0 else None)  # indexes before layouts
+        if saved is None:
+            self.index.set_meta('layout', f'{layout}/{shard_depth}')
+        elif saved != f'{layout}/{shard_depth}':
+            raise ValueError(f'{self.local_dir} was synced with layout {saved}, not {layout}/{shard_depth}')
+        self.layout = layout
+        self.shard_depth = shard_depth
+
+    def _save_state(self, last_key=None):
+        # the high-water mark follows the greatest listed key, but stays below every key which is still downloading
+        # (in any update) or has failed, so the listing after a restart or a failure resumes in front of them
+        with self.state_lock:
+            if last_key is not None and (self.listed_key is None or last_key > self.listed_key):
+                self.listed_key = last_key
+            mark = self.listed_key
+            unfinished = self.pending.union(self.failed)
+            if mark is not None and len(unfinished) > 0:
+                lowest = min(unfinished)
+                if mark >= lowest:
+                    mark = lowest[:-1]  # sorts right before the lowest unfinished key
+            if mark is None or mark == self.last_key:
+                return
+            self.last_key = mark
+            self.index.set_meta('last_key', mark)  # also commits the downloaded objects
+
+    def _requeue_failed(self, start_after):
+        # failed objects are downloaded again by the next poll. Those after start_after were in the range of the
+        # listing, so the listing queued them again unless they were deleted or filtered out in the meantime
+        update_list = []
+        with self.state_lock:
+            for key, obj in list(self.failed.items()):
+                if key in self.pending:
+                    continue
+                if start_after is None or key > start_after:
+                    LOGGER.warning('%s is no longer listed, its download is not retried', key)
+                    del self.failed[key]
+                    self.index.remove_failed(key)
+                    continue
+                update_list.append(obj)
+                self.pending.add(key)
+        return update_list
+
+    def _update(self, update_list, callback_func, callback_threshold, ignore_update=False, last_key=None):
+        # decision for whether to run callback or not; the callback order is reserved here
+        ticket = None
+        with self.state_lock:
+            if not ignore_update: self.num_update += len(update_list)
+            if self.callback_executor != None and callback_threshold != None:    # if callback is given
+                if self.num_update >= callback_threshold:                       # if num_update is enough for callback
+                    self.num_update = 0
+                    ticket = self.callback_executor.reserve()
+
+        # download start: one task per object on the shared download pool
+        LOGGER.info('%d objects are updated', len(update_list))
+        try:
+            batch = DownloadBatch(len(update_list))
+            for obj in update_list:
+                try:
+                    self.pool.submit(obj[0], self._local_path(obj[0]), obj[1], obj[2], self._on_downloaded(obj, batch))
+                except Exception as e:  # e.g. the local directory cannot be created on a full disk
+                    LOGGER.warning('%s failed to be queued for download: %s', obj[0], e)
+                    self._finish(obj, False)
+                    batch.done(obj[0], False)
+            batch.wait()
+            self.index.commit()
+            self._save_state(last_key)
+        finally:
+            # the callback turn and the pending keys are always released, otherwise every later callback
+            # and the high-water mark would wait for this update forever
+            self._release(update_list, ticket)
+        self._evict()
+
+    def _release(self, update_list, ticket):
+        with self.state_lock:
+            leftover = [obj for obj in update_list if obj[0] in self.pending]
+        for obj in leftover:
+            self._finish(obj, False)
+        # run callback after downloads are done, once the previous callbacks are done
+        if ticket != None:
+            self.callback_executor.ready(ticket)
+
+    def _on_downloaded(self, obj, batch):
+        def on_done(ok):
+            try:
+                self._record(obj, ok)
+            finally:
+                batch.done(obj[0], ok)
+        return on_done
+
+    def _record(self, obj, ok):
+        # an object which cannot be indexed (e.g. on a full disk) counts as failed and is downloaded again
+        if ok:
+            try:
+                SYNC_LAG.observe(max(time() - obj[3], 0))
+                self.index.put(*obj)
+                # without a callback, nothing tells when a file is consumed and it may be evicted right away
+                self.index.add_local(obj[0], self._local_path(obj[0]), obj[2], time(),
+                                     consumed=self.callback_executor is None)
+            except Exception as e:
+                LOGGER.warning('%s failed to be indexed: %s', obj[0], e)
+                ok = False
+        self._finish(obj, ok)
+
+    def _finish(self, obj, ok):
+        # a failed key moves from pending to failed at once, so the high-water mark never passes it in between
+        with self.state_lock:
+            try:
+                if ok:
+                    if self.failed.pop(obj[0], None) is not None:
+                        self.index.remove_failed(obj[0])
+                else:
+                    self.failed[obj[0]] = obj
+                    self.index.add_failed(*obj)
+            finally:
+                self.pending.discard(obj[0])
+
+    def _on_consumed(self, started):
+        # the files synced before a successful callback run started were seen by it
+        self.index.consume_local(started)
+        self._evict()
+
+    def _evict(self):
+        # keep local_dir within max_local_bytes by deleting the least recently synced consumed files.
+        # Evicted objects stay in the index, so they are not downloaded again unless they change in S3
+        if not self.max_local_bytes:
+            return
+        with self.evict_lock:
+            local_bytes = self.index.local_bytes()
+            num_evicted = 0
+            while local_bytes > self.max_local_bytes:
+                evictable = self.index.evictable()
+                if len(evictable) == 0:
+                    LOGGER.warning('%d bytes in %s exceed max_local_bytes, but no consumed file is left to evict',
+                                   local_bytes, self.local_dir)
+                    break
+                evicted = []
+                for key, path, size in evictable:
+                    if local_bytes <= self.max_local_bytes:
+                        break
+                    if os.path.isfile(path):
+                        os.remove(path)
+                    evicted.append(key)
+                    local_bytes -= size
+                self.index.remove_local(evicted)
+                num_evicted += len(evicted)
+            LOCAL_BYTES.set(local_bytes)
+            EVICTED.inc(num_evicted)
+            if num_evicted > 0:
+                LOGGER.info('%d files are evicted, %d bytes are kept in %s', num_evicted, local_bytes, self.local_dir)
+
+    def _accept(self, key, size, mtime):
+        # the filters of start(), and only keys which can be saved inside local_dir
+        if not self.sync_filter(key[len(self.s3_dir):], size, mtime):
+            return False
+        if self._rel_path(key) is None:
+            LOGGER.warning('%s is not synced: it has no safe local path in %s', key, self.local_dir)
+            return False
+        return True
+
+    def _rel_path(self, key):
+        # 'flat': {name}, 'prefix': {key without s3_dir}, normalized. None for a key which cannot be saved safely:
+        # a directory marker, a path resolving outside local_dir (e.g. run1/../../evil.sh) or the index file
+        if self.layout == 'prefix':
+            rel_path = os.path.normpath(key[len(self.s3_dir):])
+            if key.endswith('/') or os.path.isabs(rel_path) or rel_path in ('.', '..') or rel_path.startswith('../'):
+                return None
+        else:
+            rel_path = key.split('/')[-1]
+            if rel_path in ('', '.', '..'):
+                return None
+        if rel_path.startswith(self.INDEX_FILE):
+            return None
+        return rel_path
+
+    def _local_path(self, key):
+        # local_dir/{rel_path}, so with 'prefix' the same name in different agent runs does not collide.
+        # shard_depth > 0 adds hash directories (e.g. 3f/a2/) in front of it, which
+        # keeps the directories small when millions of objects are synced
+        rel_path = self._rel_path(key)
+        if rel_path is None:
+            raise ValueError(f'{key} has no safe local path in {self.local_dir}')
+        if self.shard_depth > 0:
+            digest = hashlib.md5(key.encode()).hexdigest()
+            rel_path = ''.join(f'{digest[2 * idx:2 * idx + 2]}/' for idx in range(self.shard_depth)) + rel_path
+        local_path = self.local_dir + rel_path
+        local_dir = os.path.dirname(local_path)
+        if local_dir not in self.made_dirs:
+            os.makedirs(local_dir, exist_ok=True)
+            self.made_dirs.add(local_dir)
+        return local_path
 
     def _dir_format(self, s3_dir, local_dir):
         # s3_dir format
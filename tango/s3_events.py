@@ -0,0 +1,101 @@
+import json
+import logging
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from queue import Queue, Empty
+from urllib.parse import unquote_plus
+
+
+LOGGER = logging.getLogger('tango')
+
+
+def parse_records(body):
+    # S3 event notification (AWS, Ceph RGW or MinIO) -> (key, etag, size) of created objects.
+    # Records without an object key (e.g. test events or malformed notifications) are skipped
+    if isinstance(body, (str, bytes)):
+        body = json.loads(body)
+    if 'Message' in body and 'Records' not in body:  # delivered through SNS
+        body = json.loads(body['Message'])
+    for record in body.get('Records', []):
+        if not isinstance(record, dict):
+            continue
+        if not str(record.get('eventName', '')).startswith(('ObjectCreated', 's3:ObjectCreated')):
+            continue
+        obj = record['s3'].get('object') if isinstance(record.get('s3'), dict) else None
+        if not isinstance(obj, dict) or 'key' not in obj:
+            LOGGER.warning('S3 event record without an object key is skipped: %s', record)
+            continue
+        yield unquote_plus(obj['key']), obj.get('eTag', '').strip('"'), obj.get('size', 0)
+
+
+class LocalEventSource:
+    # in-process stand-in for a notification queue, e.g. for tests and local S3 stand-ins without notifications
+    def __init__(self):
+        self.queue = Queue()
+
+    def put(self, body):
+        self.queue.put(body)
+
+    def events(self, timeout=1.0):
+        # yield lists of (key, etag, size); an empty list when nothing arrived within timeout
+        try:
+            body = self.queue.get(timeout=timeout)
+        except Empty:
+            return []
+        return list(parse_records(body))
+
+    def close(self):
+        pass
+
+
+class SQSEventSource:
+    # S3 -> SQS notifications, long-polled; messages are deleted once their objects are handed to the sync
+    def __init__(self, queue_url, session, endpoint_url=None, wait_time=20):
+        self.queue_url = queue_url
+        self.wait_time = wait_time
+        self.client = session.client('sqs', endpoint_url=endpoint_url)
+
+    def events(self, timeout=None):
+        response = self.client.receive_message(QueueUrl=self.queue_url, MaxNumberOfMessages=10,
+                                               WaitTimeSeconds=self.wait_time)
+        records = []
+        entries = []
+        for idx, message in enumerate(response.get('Messages', [])):
+            try:
+                records.extend(parse_records(message['Body']))
+            except (ValueError, TypeError, AttributeError) as e:  # deleted anyway, it would be delivered again forever
+                LOGGER.warning('Malformed S3 event message is skipped: %s', e)
+            entries.append({'Id': str(idx), 'ReceiptHandle': message['ReceiptHandle']})
+        if entries:
+            self.client.delete_message_batch(QueueUrl=self.queue_url, Entries=entries)
+        return records
+
+    def close(self):
+        pass
+
+
+class WebhookEventSource(LocalEventSource):
+    # HTTP push endpoint for bucket notifications, e.g. a Ceph RGW topic with push-endpoint=http://host:port
+    def __init__(self, host='0.0.0.0', port=8080):
+        super().__init__()
+        source = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                try:
+                    source.put(json.loads(body))
+                    self.send_response(200)
+                except ValueError:
+                    self.send_response(400)
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True, name='s3_event_webhook').start()
+
+    def close(self):
+        self.server.shutdown()
@@ -0,0 +1,26 @@
+from datetime import datetime
+from fnmatch import fnmatchcase
+
+
+class SyncFilter:
+    # selects the objects to sync by their key below s3_dir, size and LastModified.
+    # include/exclude are glob patterns such as '*.jpg' or '2026*/*'; since is a datetime or an epoch timestamp
+    def __init__(self, include=None, exclude=None, min_size=None, max_size=None, since=None):
+        self.include = [include] if isinstance(include, str) else include
+        self.exclude = [exclude] if isinstance(exclude, str) else exclude
+        self.min_size = min_size
+        self.max_size = max_size
+        self.since = since.timestamp() if isinstance(since, datetime) else since
+
+    def __call__(self, rel_key, size, mtime):
+        if self.include and not any(fnmatchcase(rel_key, pattern) for pattern in self.include):
+            return False
+        if self.exclude and any(fnmatchcase(rel_key, pattern) for pattern in self.exclude):
+            return False
+        if self.min_size is not None and size < self.min_size:
+            return False
+        if self.max_size is not None and size > self.max_size:
+            return False
+        if self.since is not None and mtime < self.since:
+            return False
+        return True
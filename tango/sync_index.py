@@ -0,0 +1,115 @@
+import sqlite3
+import threading
+
+
+class SyncIndex:
+    # on-disk state of S3DirSync: one row per synced S3 key with its ETag, size and LastModified,
+    # plus small key/value metadata such as the listing high-water mark
+    def __init__(self, path, commit_every=1000):
+        self.path = path
+        self.commit_every = commit_every
+        self.num_uncommitted = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        # WITHOUT ROWID stores the rows in the primary key b-tree, which keeps millions of keys compact
+        self.conn.execute('CREATE TABLE IF NOT EXISTS objects '
+                          '(key TEXT PRIMARY KEY, etag TEXT, size INTEGER, mtime REAL) WITHOUT ROWID')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT) WITHOUT ROWID')
+        # synced files still present in local_dir; consumed files may be evicted to stay within a disk budget
+        self.conn.execute('CREATE TABLE IF NOT EXISTS local_files '
+                          '(key TEXT PRIMARY KEY, path TEXT, size INTEGER, synced REAL, consumed INTEGER) WITHOUT ROWID')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS local_files_lru ON local_files (consumed, synced)')
+        # objects whose download failed; they hold the listing high-water mark back and are retried every poll
+        self.conn.execute('CREATE TABLE IF NOT EXISTS failed '
+                          '(key TEXT PRIMARY KEY, etag TEXT, size INTEGER, mtime REAL) WITHOUT ROWID')
+        self.conn.commit()
+
+    def get(self, key):
+        with self.lock:
+            return self.conn.execute('SELECT etag, size, mtime FROM objects WHERE key=?', (key,)).fetchone()
+
+    def is_changed(self, key, etag, size):
+        # new keys and keys whose content changed since they were synced
+        row = self.get(key)
+        return row is None or row[0] != etag or row[1] != size
+
+    def put(self, key, etag, size, mtime):
+        with self.lock:
+            self.conn.execute('INSERT OR REPLACE INTO objects VALUES (?, ?, ?, ?)', (key, etag, size, mtime))
+            self.num_uncommitted += 1
+            if self.num_uncommitted >= self.commit_every:
+                self._commit()
+
+    def delete(self, key):
+        with self.lock:
+            self.conn.execute('DELETE FROM objects WHERE key=?', (key,))
+            self._commit()
+
+    def add_local(self, key, path, size, synced, consumed=False):
+        with self.lock:
+            self.conn.execute('INSERT OR REPLACE INTO local_files VALUES (?, ?, ?, ?, ?)',
+                              (key, path, size, synced, int(consumed)))
+
+    def consume_local(self, until):
+        # files synced up to until were handed to a consumer, e.g. a callback which started at until
+        with self.lock:
+            self.conn.execute('UPDATE local_files SET consumed=1 WHERE consumed=0 AND synced<=?', (until,))
+            self._commit()
+
+    def local_bytes(self):
+        with self.lock:
+            return self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM local_files').fetchone()[0]
+
+    def evictable(self, limit=1000):
+        # least recently synced consumed files first
+        with self.lock:
+            return self.conn.execute('SELECT key, path, size FROM local_files WHERE consumed=1 '
+                                     'ORDER BY synced LIMIT ?', (limit,)).fetchall()
+
+    def remove_local(self, keys):
+        with self.lock:
+            self.conn.executemany('DELETE FROM local_files WHERE key=?', [(key,) for key in keys])
+            self._commit()
+
+    def add_failed(self, key, etag, size, mtime):
+        with self.lock:
+            self.conn.execute('INSERT OR REPLACE INTO failed VALUES (?, ?, ?, ?)', (key, etag, size, mtime))
+            self._commit()
+
+    def remove_failed(self, key):
+        with self.lock:
+            self.conn.execute('DELETE FROM failed WHERE key=?', (key,))
+            self._commit()
+
+    def failed(self):
+        with self.lock:
+            return self.conn.execute('SELECT key, etag, size, mtime FROM failed').fetchall()
+
+    def get_meta(self, name, default=None):
+        with self.lock:
+            row = self.conn.execute('SELECT value FROM meta WHERE name=?', (name,)).fetchone()
+        return default if row is None else row[0]
+
+    def set_meta(self, name, value):
+        with self.lock:
+            self.conn.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', (name, value))
+            self._commit()
+
+    def commit(self):
+        with self.lock:
+            self._commit()
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute('SELECT COUNT(*) FROM objects').fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self._commit()
+            self.conn.close()
+
+    def _commit(self):
+        self.conn.commit()
+        self.num_uncommitted = 0
@@ -0,0 +1,182 @@
+import threading
+
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip('boto3')
+
+from run_sync import S3DirSync
+from sync_index import SyncIndex
+
+
+class ManualPool:
+    # download pool whose downloads finish only when the test says so
+    def __init__(self):
+        self.submitted = {}
+        self.cond = threading.Condition()
+
+    def submit(self, key, local_path, etag, size, on_done):
+        with self.cond:
+            self.submitted[key] = on_done
+            self.cond.notify_all()
+
+    def finish(self, key, ok=True):
+        with self.cond:
+            self.cond.wait_for(lambda: key in self.submitted, timeout=5)
+            on_done = self.submitted.pop(key)
+        on_done(ok)
+
+
+class FakeClient:
+    # ListObjectsV2 over a dict of key: size
+    def __init__(self, sizes):
+        self.sizes = sizes
+
+    def get_paginator(self, name):
+        return self
+
+    def paginate(self, Bucket, Prefix, StartAfter=None):
+        keys = sorted(k for k in self.sizes if k.startswith(Prefix) and (StartAfter is None or k > StartAfter))
+        yield {'Contents': [{'Key': k, 'ETag': '"etag"', 'Size': self.sizes[k], 'LastModified': datetime.now()}
+                            for k in keys]}
+
+
+def make_sync(local_dir, sizes):
+    sync = S3DirSync('bucket', 'access_key', 'secret_key')
+    sync.client = FakeClient(sizes)
+    sync.pool = ManualPool()
+    sync.s3_dir, sync.local_dir = sync._dir_format('pre/', str(local_dir))
+    sync.index = SyncIndex(sync.local_dir + sync.INDEX_FILE)
+    sync._load_state()
+    return sync
+
+
+def start_update(sync, update_list, last_key):
+    trd = threading.Thread(target=sync._update, args=(update_list, None, None, False, last_key), daemon=True)
+    trd.start()
+    return trd
+
+
+def test_mark_stays_below_failed_download_in_lower_directory(tmp_path):
+    low = [f'pre/000/{i}.jpg' for i in range(3)]
+    high = [f'pre/002/{i}.jpg' for i in range(5)]
+    sync = make_sync(tmp_path, {key: 1 for key in low + high})
+
+    # the first poll lists pre/000/ while it is being written, the second poll lists pre/002/
+    low_list, low_last = sync._list_updates()
+    low_trd = start_update(sync, low_list, low_last)
+    sync.client.sizes.update({key: 1 for key in high})
+    high_list, high_last = sync._list_updates(sync._resume_key(low_last))
+    high_list = [obj for obj in high_list if obj[0] in high]
+    high_trd = start_update(sync, high_list, high_last)
+
+    # the later update finishes first: the mark must not pass the keys still downloading
+    for key in high:
+        sync.pool.finish(key)
+    high_trd.join(5)
+    assert sync.last_key < low[0]
+
+    # a download in the lower directory fails: the mark stays below it, also after a restart
+    sync.pool.finish(low[0], ok=False)
+    for key in low[1:]:
+        sync.pool.finish(key)
+    low_trd.join(5)
+    assert sync.last_key < low[0]
+    assert [row[0] for row in sync.index.failed()] == [low[0]]
+
+    restarted = make_sync(tmp_path, sync.client.sizes)
+    assert restarted.last_key == sync.last_key
+    update_list, last_key = restarted._list_updates(restarted._resume_key(restarted.last_key))
+    assert [obj[0] for obj in update_list] == [low[0]]
+
+    # once the retry succeeds, the mark moves up to the greatest listed key
+    trd = start_update(restarted, update_list, last_key)
+    restarted.pool.finish(low[0])
+    trd.join(5)
+    assert restarted.last_key == high[-1]
+    assert restarted.index.failed() == []
+
+
+def test_failed_key_deleted_from_s3_is_dropped(tmp_path):
+    sync = make_sync(tmp_path, {'pre/000/0.jpg': 1, 'pre/000/1.jpg': 1})
+    update_list, last_key = sync._list_updates()
+    trd = start_update(sync, update_list, last_key)
+    sync.pool.finish('pre/000/0.jpg', ok=False)
+    sync.pool.finish('pre/000/1.jpg')
+    trd.join(5)
+    assert sync.last_key < 'pre/000/0.jpg'
+
+    del sync.client.sizes['pre/000/0.jpg']
+    update_list, last_key = sync._list_updates(sync._resume_key(sync.last_key))
+    assert update_list == []
+    sync._save_state(last_key)
+    assert sync.last_key == 'pre/000/1.jpg'
+    assert sync.index.failed() == []
+
+
+def poll(sync, num_poll, full_list_every):
+    update_list, last_key = sync._list_updates(sync._start_after(num_poll, full_list_every))
+    for obj in update_list:
+        sync.index.put(*obj)
+        with sync.state_lock:
+            sync.pending.discard(obj[0])
+    sync._save_state(last_key)
+    return [obj[0] for obj in update_list]
+
+
+def test_late_key_in_lower_directory_is_listed_by_full_listing(tmp_path):
+    sync = make_sync(tmp_path, {'pre/202601011200/a.jpg': 1})
+    assert poll(sync, 0, 3) == ['pre/202601011200/a.jpg']
+    sync.client.sizes['pre/202601011300/b.jpg'] = 1
+    assert poll(sync, 1, 3) == ['pre/202601011300/b.jpg']
+
+    # a late upload into the older run directory is below the resume key of the incremental listing
+    sync.client.sizes['pre/202601011200/late.jpg'] = 1
+    assert poll(sync, 2, 3) == []
+    assert poll(sync, 3, 3) == ['pre/202601011200/late.jpg']
+
+
+class FailingPool(ManualPool):
+    # download pool which cannot queue one of the keys, e.g. its local directory cannot be created
+    def __init__(self, bad_key):
+        super().__init__()
+        self.bad_key = bad_key
+
+    def submit(self, key, local_path, etag, size, on_done):
+        if key == self.bad_key:
+            raise OSError('No space left on device')
+        super().submit(key, local_path, etag, size, on_done)
+
+
+def test_update_releases_pending_keys_when_a_download_cannot_be_queued(tmp_path):
+    sync = make_sync(tmp_path, {'pre/000/0.jpg': 1, 'pre/000/1.jpg': 1})
+    sync.pool = FailingPool('pre/000/0.jpg')
+    update_list, last_key = sync._list_updates()
+    trd = start_update(sync, update_list, last_key)
+    sync.pool.finish('pre/000/1.jpg')
+    trd.join(5)
+    assert not trd.is_alive()
+    assert sync.pending == set()
+    assert list(sync.failed) == ['pre/000/0.jpg']
+    assert sync.last_key < 'pre/000/0.jpg'
+
+
+def test_keys_resolving_outside_local_dir_are_not_synced(tmp_path):
+    local_dir = tmp_path / 'local'
+    local_dir.mkdir()
+    sync = make_sync(local_dir, {'pre/run1/../../../escape/evil.sh': 1, 'pre//etc/evil.sh': 1, 'pre/run1/..': 1,
+                                 'pre/run1/': 0, 'pre/.s3dirsync.db': 1, 'pre/run1/../run2/a.jpg': 1})
+    sync._set_layout('prefix', 0)
+    update_list, last_key = sync._list_updates()
+    assert [obj[0] for obj in update_list] == ['pre/run1/../run2/a.jpg']
+    assert sync._local_path('pre/run1/../run2/a.jpg') == sync.local_dir + 'run2/a.jpg'
+    with pytest.raises(ValueError):
+        sync._local_path('pre/run1/../../../escape/evil.sh')
+    assert not (tmp_path / 'escape').exists()
+
+    # the flat layout keeps only the name, which must not be empty, '.' or '..'
+    (tmp_path / 'flat').mkdir()
+    flat = make_sync(tmp_path / 'flat', {'pre/run1/..': 1, 'pre/run1/.': 1, 'pre/run1/': 0, 'pre/run1/a.jpg': 1})
+    update_list, last_key = flat._list_updates()
+    assert [obj[0] for obj in update_list] == ['pre/run1/a.jpg']
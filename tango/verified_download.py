@@ -0,0 +1,164 @@
+import hashlib
+import os
+import re
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+MB = 1024 * 1024
+READ_SIZE = 1 * MB
+# part sizes commonly used by S3 clients, tried to reproduce multipart ETags
+PART_SIZES = (8 * MB, 16 * MB, 5 * MB, 15 * MB, 32 * MB, 64 * MB, 100 * MB)
+
+
+class IntegrityError(Exception):
+    pass
+
+
+def _md5(path, start=0, length=None):
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = length
+        while remaining is None or remaining > 0:
+            data = f.read(READ_SIZE if remaining is None else min(READ_SIZE, remaining))
+            if not data:
+                break
+            md5.update(data)
+            if remaining is not None:
+                remaining -= len(data)
+    return md5
+
+
+def _multipart_etag(path, size, part_size):
+    digests = b''.join(_md5(path, start, part_size).digest() for start in range(0, size, part_size))
+    return f'{hashlib.md5(digests).hexdigest()}-{-(-size // part_size)}'
+
+
+def verify(path, etag, size):
+    # size always; MD5 for single-part ETags; multipart ETags when one of the common part sizes reproduces them
+    local_size = os.path.getsize(path)
+    if local_size != size:
+        raise IntegrityError(f'{path}: {local_size} bytes instead of {size}')
+    if not re.fullmatch(r'[0-9a-f]{32}(-\d+)?', etag or ''):
+        return False  # e.g. SSE-KMS objects, whose ETag is not an MD5
+    if '-' not in etag:
+        if _md5(path).hexdigest() != etag:
+            raise IntegrityError(f'{path}: MD5 does not match ETag {etag}')
+        return True
+    num_part = int(etag.split('-')[1])
+    part_size = -(-size // num_part)
+    candidates = [p for p in (*PART_SIZES, -(-part_size // MB) * MB) if -(-size // p) == num_part]
+    for candidate in dict.fromkeys(candidates):
+        if _multipart_etag(path, size, candidate) == etag:
+            return True
+    return False  # the part size of the upload is unknown, only the size is verified
+
+
+def prepare_part(part_path, etag):
+    # the bytes of a .part file are only resumed for the ETag they were downloaded for, kept in part_path + '.etag';
+    # a .part file of another ETag (the object was overwritten since) or of an unknown one is discarded
+    etag_path = part_path + '.etag'
+    saved = None
+    if os.path.isfile(etag_path):
+        with open(etag_path, 'r') as f:
+            saved = f.read().strip()
+    if not etag or saved != etag:
+        _remove(part_path, part_path + '.done')
+        with open(etag_path, 'w') as f:
+            f.write(etag or '')
+
+
+def download_verified(client, bucket, key, local_path, etag, size, multipart_threshold=64 * MB,
+                      chunk_size=16 * MB, concurrency=4, callback=None):
+    # download into local_path + '.part', verify it and rename it to local_path, so readers of local_path never
+    # see a partial object. An interrupted download resumes from the existing .part file on the next call.
+    part_path = local_path + '.part'
+    prepare_part(part_path, etag)
+    try:
+        if size >= multipart_threshold:
+            _download_ranges(client, bucket, key, part_path, etag, size, chunk_size, concurrency, callback)
+        else:
+            _download_stream(client, bucket, key, part_path, etag, size, callback)
+        verify(part_path, etag, size)
+    except IntegrityError:
+        _remove(part_path, part_path + '.done')
+        raise
+    except Exception as e:
+        if _error_code(e) in ('412', 'PreconditionFailed'):  # modified while downloading, the parts are stale
+            _remove(part_path, part_path + '.done')
+        raise
+    _remove(part_path + '.done', part_path + '.etag')
+    os.replace(part_path, local_path)
+
+
+def _download_stream(client, bucket, key, part_path, etag, size, callback=None):
+    # a single GET, resumed with a ranged GET after the bytes already in part_path
+    offset = os.path.getsize(part_path) if os.path.isfile(part_path) else 0
+    if offset >= size or os.path.isfile(part_path + '.done'):
+        offset = 0
+    kwargs = _get_kwargs(bucket, key, etag)
+    if offset > 0:
+        kwargs['Range'] = f'bytes={offset}-'
+    response = client.get_object(**kwargs)
+    with open(part_path, 'ab' if offset > 0 else 'wb') as f:
+        for chunk in response['Body'].iter_chunks(READ_SIZE):
+            f.write(chunk)
+            if callback:
+                callback(len(chunk))
+
+
+def _download_ranges(client, bucket, key, part_path, etag, size, chunk_size, concurrency, callback=None):
+    # concurrent ranged GETs into a preallocated file; finished parts are appended to part_path + '.done'
+    done_path = part_path + '.done'
+    done = set()
+    if os.path.isfile(part_path) and os.path.isfile(done_path) and os.path.getsize(part_path) == size:
+        with open(done_path, 'r') as f:
+            done = {int(line) for line in f if line.strip()}
+    else:
+        with open(part_path, 'wb') as f:
+            f.truncate(size)
+        open(done_path, 'w').close()
+
+    lock = threading.Lock()
+    fd = os.open(part_path, os.O_WRONLY)
+    try:
+        def fetch(idx):
+            start = idx * chunk_size
+            end = min(start + chunk_size, size) - 1
+            response = client.get_object(Range=f'bytes={start}-{end}', **_get_kwargs(bucket, key, etag))
+            offset = start
+            for chunk in response['Body'].iter_chunks(READ_SIZE):
+                os.pwrite(fd, chunk, offset)
+                offset += len(chunk)
+                if callback:
+                    callback(len(chunk))
+            if offset != end + 1:
+                raise IntegrityError(f'{key}: range {start}-{end} ended at {offset}')
+            with lock, open(done_path, 'a') as f:
+                f.write(f'{idx}\n')
+
+        todo = [idx for idx in range(-(-size // chunk_size)) if idx not in done]
+        with ThreadPoolExecutor(concurrency) as executor:
+            list(executor.map(fetch, todo))  # re-raises the first failure
+    finally:
+        os.close(fd)
+
+
+def _get_kwargs(bucket, key, etag):
+    # If-Match keeps the parts of a resumed download from mixing two versions of the object
+    kwargs = {'Bucket': bucket, 'Key': key}
+    if etag:
+        kwargs['IfMatch'] = f'"{etag}"'
+    return kwargs
+
+
+def _error_code(e):
+    return getattr(e, 'response', {}).get('Error', {}).get('Code')
+
+
+def _remove(*paths):
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)